@@ -14,26 +14,80 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# Parse google chinese n-gram, filtered from https://storage.googleapis.com/books/ngrams/books/datasetsv3.html
+# Parse google chinese n-gram from https://storage.googleapis.com/books/ngrams/books/datasetsv3.html
+# Input: the files in sys.argv (or stdin), either gzipped or not, in "ngram\tyear,count,volumes\t..." format
+# Only the single Han characters are kept (like perl's /^\p{Han}\t/), converted with OpenCC,
+# and their counts summed up. Output is "char,count" in the order of first appearance.
+# If the first argument is "--jobs N", the blocks of input are parsed by N processes.
 
-import fileinput
+import gzip
+import sys
 
-from opencc import OpenCC
+import regex
+
+from MordioScripts.parallel import mapOrdered
+from MordioScripts.textconv import BatchConverter
+
+SIZE_BLOCK = 4 << 20 # Bytes of decompressed input sent to a worker at once
+
+_reHan = regex.compile(R'\p{scx=Han}')
+objConv = None
+
+def initConverter(nameConfig):
+    global objConv
+    objConv = BatchConverter(nameConfig)
+
+def parseBlock(block):
+    # Return [(char, count)] of the Han characters in a block of complete lines
+    aChars = []
+    aCounts = []
+    for line in block.split(b'\n'):
+        posTab = line.find(b'\t')
+        if posTab < 1 or posTab > 4: # A single character is 1 to 4 bytes in UTF-8
+            continue
+        c = line[:posTab].decode('utf-8')
+        if len(c) != 1 or not _reHan.match(c):
+            continue
+        # year,count,volumes triplets, all separated the same way
+        aNums = line[posTab+1:].replace(b'\t', b',').split(b',')
+        aChars.append(c)
+        aCounts.append(sum(map(int, aNums[1::3])))
+    return list(zip(objConv.convertBatch(aChars), aCounts))
+
+def readBlocks(aFnames):
+    for fname in aFnames:
+        fp = sys.stdin.buffer if fname == '-' else open(fname, 'rb')
+        if fp.peek(2)[:2] == b'\x1f\x8b':
+            fp = gzip.GzipFile(fileobj=fp)
+        rest = b''
+        while True:
+            block = fp.read(SIZE_BLOCK)
+            if len(block) == 0:
+                break
+            posEnd = block.rfind(b'\n') + 1
+            if posEnd == 0:
+                rest += block
+                continue
+            yield rest + block[:posEnd]
+            rest = block[posEnd:]
+        if len(rest) > 0:
+            yield rest
+        fp.close()
 
 def main():
-    objOpenCC = OpenCC('s2tw.json')
+    nJobs = 1
+    if len(sys.argv) > 1 and sys.argv[1] == '--jobs':
+        sys.argv.pop(1)
+        nJobs = int(sys.argv.pop(1))
+    aFnames = sys.argv[1:] or ['-']
 
-    aOrder = []
     mCount = {}
-    for line in fileinput.input():
-        c, strRecords = line.strip().split('\t', 1)
-        c = objOpenCC.convert(c)
-        countThis = sum(int(rec.split(',')[1]) for rec in strRecords.split('\t'))
-        aOrder.append(c)
-        mCount[c] = mCount.get(c, 0) + countThis
-
-    for c in aOrder:
-        print(F'{c},{mCount[c]}')
+    for aRslts in mapOrdered(parseBlock, readBlocks(aFnames), nJobs, 1, initializer=initConverter, initargs=('s2tw.json',)):
+        for c, countThis in aRslts:
+            mCount[c] = mCount.get(c, 0) + countThis
+
+    sys.stdout.reconfigure(encoding='utf-8')
+    sys.stdout.writelines(F'{c},{count}\n' for c, count in mCount.items())
 
 if __name__ == '__main__':
     main()
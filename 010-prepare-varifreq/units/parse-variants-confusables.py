@@ -18,15 +18,23 @@
 # Need two additional files:
 #   sys.argv[1] ICU confusable.txt
 #   sys.argv[2] character frequency table for tie-breaking
+# The variants of each good char, and the good chars of each variant char, are kept as dicts
+# (insertion-ordered sets), so that lookups and deletions don't need to scan lists.
+# The time taken by each step is reported to stderr.
 
 import csv
 import fileinput
 import re
 import sys
+import time
 import unicodedata
 
-from opencc import OpenCC
+from MordioScripts.textconv import BatchConverter
 
+def logTime(nameStep, timeStart):
+    timeNow = time.perf_counter()
+    print(F"{nameStep}: {timeNow - timeStart:.3f}s", file=sys.stderr)
+    return timeNow
 
 def main():
     modeOld = False
@@ -34,7 +42,8 @@ def main():
         modeOld = True
         sys.argv.pop(1)
 
-    objOpenCC = OpenCC('s2tw.json')
+    objConv = BatchConverter('s2tw.json')
+    timeStart = time.perf_counter()
 
     # Read ICU confusable table
     mConfusable = {}
@@ -67,13 +76,14 @@ def main():
         objReader = csv.DictReader(fp)
         for row in objReader:
             mFreq[row['char']] = int(row['freq'])
+    timeStart = logTime("Reading confusables and frequencies", timeStart)
 
     # Read the real deal
     sys.stdin.reconfigure(encoding='utf-8')
     mGoodChar = {} # The main good chars table
     mCharId = {} # The reverse table of each good chars
     mVar = {} # Variants
-    mVarId = {} # The reverse table of each variant chars
+    mVarId = {} # The reverse table of each variant chars: variant char -> {cid: True}
     for line in sys.stdin:
         if modeOld:
             dumb, line = line.split('\t', 1)
@@ -102,7 +112,7 @@ def main():
             c = unicodedata.normalize('NFKC', c)
 
         if c not in mVarId:
-            mVarId[c] = []
+            mVarId[c] = {}
         mVar[cid] = c
 
         if tag == '正':
@@ -111,12 +121,13 @@ def main():
                 mGoodChar[cid] = mGoodChar[mCharId[c]]
                 continue
             mGoodChar[cid] = {
-                    'variants': [c],
+                    'variants': {c: True},
                     'char': c,
                     'freq': mFreq.get(c, 0),
                     }
             mCharId[c] = cid
-            mVarId[c].append(cid)
+            mVarId[c][cid] = True
+    timeStart = logTime("Reading variants", timeStart)
 
     # Step 10: build missing good chars with lowest-numbered variant
     for cid in sorted(mVar):
@@ -125,11 +136,12 @@ def main():
         if c in mCharId: continue
         if cidGood in mGoodChar: continue
         mGoodChar[cidGood] = {
-                'variants': [c],
+                'variants': {c: True},
                 'char': c,
                 'freq': mFreq.get(c, 0),
                 }
         mCharId[c] = cidGood
+    timeStart = logTime("Step 10", timeStart)
 
     # Step 20: Put ICU confusable chars into the mix
     numICU = 0
@@ -142,18 +154,19 @@ def main():
             mGoodChar[idICU] = {
                     'char': c2,
                     'freq': mFreq.get(c2, 0),
-                    'variants': [c2],
+                    'variants': {c2: True},
                     }
         else:
             idICU = mCharId[c2]
 
         # The "source" char is considered a variant of the "target" char
         if c2 not in mVarId:
-            mVarId[c2] = [idICU]
+            mVarId[c2] = {idICU: True}
         if c1 not in mVarId:
-            mVarId[c1] = []
+            mVarId[c1] = {}
         idICUVar = F'{idICU}-999'
         mVar[idICUVar] = c1
+    timeStart = logTime("Step 20", timeStart)
 
     # Step 30: file all variants into GoodChars table
     for cid in sorted(mVar):
@@ -179,24 +192,39 @@ def main():
             continue
 
         # Add it
-        mGoodChar[cidGood]['variants'].append(c)
-        mVarId[c].append(cidGood)
+        mGoodChar[cidGood]['variants'][c] = True
+        mVarId[c][cidGood] = True
+    timeStart = logTime("Step 30", timeStart)
 
     # Step 110: Dedup variants
+    mTrad = dict(zip(mVarId, objConv.convertBatch(tuple(mVarId))))
+    # (These used to be removals from a list while iterating over it, which skip the entry after each removed one;
+    # the same entries are skipped here to keep the same results)
     for v, aCid in tuple(mVarId.items()):
         # Check if this good char was deleted in the last step
-        for cid in aCid:
+        isSkip = False
+        for cid in tuple(aCid):
+            if isSkip:
+                isSkip = False
+                continue
             if cid not in mGoodChar:
-                aCid.remove(cid)
+                del aCid[cid]
+                isSkip = True
         if len(aCid) <= 1: continue
         # First, see if said character is a simplified version of another char
         # If there's none, then decide by word frequency
-        vTrad = objOpenCC.convert(v)
+        vTrad = mTrad[v]
         cidKeep = max(aCid, key=lambda cid: int(mGoodChar[cid]['char'] == vTrad and not cid.startswith("c"))*10000000 + mGoodChar[cid]['freq'])
-        for cid in aCid:
+        isSkip = False
+        for cid in tuple(aCid):
+            if isSkip:
+                isSkip = False
+                continue
             if cid == cidKeep: continue
-            mGoodChar[cid]['variants'].remove(v)
-            mVarId[v].remove(cid)
+            del mGoodChar[cid]['variants'][v]
+            del aCid[cid]
+            isSkip = True
+    timeStart = logTime("Step 110", timeStart)
 
     # Step 130: delete all good chars that actually has no variants
     for cid in sorted(mGoodChar):
@@ -205,15 +233,18 @@ def main():
         if c in mCharId:
             del mCharId[c]
         del mGoodChar[cid]
+    timeStart = logTime("Step 130", timeStart)
 
     # Step 210: Change the good char if it can be converted to traditional chinese which match one of its variants
     # (Will probably break mCharId here)
-    for cid, m in mGoodChar.items():
-        if len(m['variants']) <= 1: continue
+    aCids = [cid for cid, m in mGoodChar.items() if len(m['variants']) > 1]
+    aCharsNew = objConv.convertBatch([mGoodChar[cid]['char'] for cid in aCids])
+    for cid, charNew in zip(aCids, aCharsNew):
+        m = mGoodChar[cid]
         charOrig = m['char']
-        charNew = objOpenCC.convert(charOrig)
         if charOrig != charNew and charNew in m['variants']:
             m['char'] = charNew
+    timeStart = logTime("Step 210", timeStart)
 
     # Finally, print! and skip empty good chars
     sys.stdout.reconfigure(encoding='utf-8')
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Bootstrap of weighted means of many columns at once, with shared resamples
+#
+# A batch of resamples is a (nResample, nData) matrix of how many times each sample is drawn,
+# so the weighted means of all the columns in all the resamples are two matrix products.
+# Each batch has its own random stream spawned from one seed, so the resamples only depend on the seed
+# (not on the number of processes), and every column sees the same resamples.
+# The confidence intervals are BCa, the same as the default of scipy.stats.bootstrap.
+# The approximate randomization test works the same way, with a matrix of random signs instead of counts.
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+from MordioScripts.parallel import mapOrdered
+
+N_RESAMPLE = 9999 # The default of scipy.stats.bootstrap
+SIZE_BATCH_MAX = 1000 # Resamples computed together
+SIZE_BATCH_ELEMENTS = 1<<22 # ... but no more than this many resampled indices at once
+
+def makeBatches(nData, nResample=N_RESAMPLE, seed=None):
+    """Split nResample resamples into batches, return a list of (random seed, number of resamples) of each batch
+
+    seed is an int, None (random), or a np.random.SeedSequence
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    sizeBatch = max(1, min(SIZE_BATCH_MAX, SIZE_BATCH_ELEMENTS // max(nData, 1)))
+    aSizes = [min(sizeBatch, nResample - i) for i in range(0, nResample, sizeBatch)]
+    return list(zip(seed.spawn(len(aSizes)), aSizes))
+
+def resampleCounts(nData, seedBatch, nResample):
+    """The (nResample, nData) matrix of how many times each sample is drawn in each resample of a batch"""
+    aIdx = np.random.default_rng(seedBatch).integers(0, nData, (nResample, nData))
+    aIdx += np.arange(nResample)[:, np.newaxis] * nData # Index into the flattened matrix
+    return np.bincount(aIdx.ravel(), minlength=nResample*nData).reshape(nResample, nData).astype(np.float64)
+
+def resampleSigns(nData, seedBatch, nResample):
+    """The (nResample, nData) matrix of random +1/-1, i.e. whether the two sides of each sample are swapped"""
+    return np.random.default_rng(seedBatch).integers(0, 2, (nResample, nData)).astype(np.float64) * 2 - 1
+
+# The data of the current bootstrap, set up by the initializer in the main process and inherited by the forked workers
+_mtxWeighted = None
+_vWeights = None
+
+def _initWeightedMeans(mtxWeighted, vWeights):
+    global _mtxWeighted, _vWeights
+    _mtxWeighted = mtxWeighted
+    _vWeights = vWeights
+
+def _weightedMeansBatch(batch):
+    mtxCount = resampleCounts(len(_vWeights), *batch)
+    return (mtxCount @ _mtxWeighted) / (mtxCount @ _vWeights)[:, np.newaxis]
+
+def bootstrapWeightedMeans(mtxData, vWeights, nResample=N_RESAMPLE, seed=None, nJobs=1):
+    """Weighted means of each column of the (nData, nCol) mtxData, in each resample, as a (nResample, nCol) matrix"""
+    mtxWeighted = mtxData * vWeights[:, np.newaxis]
+    aBatches = makeBatches(len(vWeights), nResample, seed)
+    return np.concatenate(list(mapOrdered(_weightedMeansBatch, aBatches, nJobs, 1,
+                                          _initWeightedMeans, (mtxWeighted, vWeights))), axis=0)
+
+def _signFlippedMeansBatch(batch):
+    mtxSign = resampleSigns(len(_vWeights), *batch)
+    return (mtxSign @ _mtxWeighted) / _vWeights.sum()
+
+def randomizeWeightedMeans(mtxDiff, vWeights, nResample=N_RESAMPLE, seed=None, nJobs=1):
+    """Weighted means of each column of the (nData, nCol) paired differences mtxDiff,
+    with the sign of each sample randomly flipped, as a (nResample, nCol) matrix"""
+    mtxWeighted = mtxDiff * vWeights[:, np.newaxis]
+    aBatches = makeBatches(len(vWeights), nResample, seed)
+    return np.concatenate(list(mapOrdered(_signFlippedMeansBatch, aBatches, nJobs, 1,
+                                          _initWeightedMeans, (mtxWeighted, vWeights))), axis=0)
+
+def weightedMeans(mtxData, vWeights):
+    return (vWeights @ mtxData) / vWeights.sum()
+
+def jackknifeWeightedMeans(mtxData, vWeights):
+    """Weighted means of each column with each sample left out, as a (nData, nCol) matrix"""
+    mtxWeighted = mtxData * vWeights[:, np.newaxis]
+    return (mtxWeighted.sum(axis=0) - mtxWeighted) / (vWeights.sum() - vWeights)[:, np.newaxis]
+
+def bcaInterval(mtxBoot, vEstimate, mtxJackknife, confidenceLevel=0.95):
+    """Bias-corrected and accelerated confidence interval of each column, as (lower, upper) arrays
+
+    mtxBoot is (nResample, nCol), vEstimate is the statistic on the original data, mtxJackknife is (nData, nCol)
+    """
+    # Bias correction: where the original estimate is in the bootstrap distribution
+    percentile = (np.count_nonzero(mtxBoot < vEstimate, axis=0) + np.count_nonzero(mtxBoot <= vEstimate, axis=0)) / (2 * mtxBoot.shape[0])
+    z0 = ndtri(percentile)
+
+    # Acceleration, from the jackknife
+    nData = mtxJackknife.shape[0]
+    mtxU = (nData - 1) * (mtxJackknife.mean(axis=0) - mtxJackknife)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = 1/6 * (np.sum(mtxU**3, axis=0) / nData**3) / (np.sum(mtxU**2, axis=0) / nData**2)**(3/2)
+
+    alpha = (1 - confidenceLevel) / 2
+    zAlpha = ndtri(alpha)
+    aLower = np.empty(mtxBoot.shape[1])
+    aUpper = np.empty(mtxBoot.shape[1])
+    for i in range(mtxBoot.shape[1]):
+        num1 = z0[i] + zAlpha
+        num2 = z0[i] - zAlpha
+        alpha1 = ndtr(z0[i] + num1/(1 - a[i]*num1))
+        alpha2 = ndtr(z0[i] + num2/(1 - a[i]*num2))
+        if np.isnan(alpha1) or np.isnan(alpha2):
+            aLower[i], aUpper[i] = np.nan, np.nan
+        else:
+            aLower[i], aUpper[i] = np.quantile(mtxBoot[:, i], (alpha1, alpha2))
+    return aLower, aUpper
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tools for the user-supplied python expressions in table-filter and friends
+#
+# The vectorizable subset of expressions, evaluated once over whole numpy columns:
+#   record['field'][0]: the value of that field (each key must have exactly one)
+#   record[fieldKey]: the key itself
+#   numbers and strings, + - * / // % **, unary + - and not
+#   comparisons (also chained ones like 1 < record['x'] < 5), except in/is
+#   and/or between comparisons
+# Anything else (function calls, attribute access, other indices, ...) is not vectorizable,
+# including a bare record['field'], which is the list of all the values of that field
+
+import ast
+import operator
+
+class NotVectorizable(Exception):
+    pass
+
+class _Vectorizer(ast.NodeTransformer):
+    # Rewrite a row-wise expression into one working on numpy columns
+    # Each referenced field is replaced by a variable named _col0, _col1, ...
+    # Arithmetic operators, and the name of the same function in the operator module
+    mOpsBin = {ast.Add: 'add', ast.Sub: 'sub', ast.Mult: 'mul', ast.Div: 'truediv', ast.FloorDiv: 'floordiv', ast.Mod: 'mod', ast.Pow: 'pow'}
+    aOpsCmp = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+
+    def __init__(self, nameRecord, fieldKey):
+        self.nameRecord = nameRecord
+        self.fieldKey = fieldKey
+        self.mFields = {} # field name -> column variable name
+
+    def isBoolean(self, node):
+        if isinstance(node, ast.Constant):
+            return isinstance(node.value, bool)
+        if isinstance(node, ast.UnaryOp):
+            return isinstance(node.op, ast.Not)
+        return isinstance(node, (ast.Compare, ast.BoolOp))
+
+    def getField(self, node):
+        # record['field'][0] or record[fieldKey], otherwise None
+        if isinstance(node.slice, ast.Constant) and node.slice.value == 0 and isinstance(node.value, ast.Subscript):
+            field = self.getFieldName(node.value)
+            if field == self.fieldKey: # That would be the first character of the key
+                return None
+            return field
+        field = self.getFieldName(node)
+        if field != self.fieldKey: # A list of values
+            return None
+        return field
+
+    def getFieldName(self, node):
+        # The field name of record['field'], otherwise None
+        if not isinstance(node.value, ast.Name) or node.value.id != self.nameRecord:
+            return None
+        if not isinstance(node.slice, ast.Constant) or not isinstance(node.slice.value, str):
+            return None
+        return node.slice.value
+
+    def generic_visit(self, node):
+        if not isinstance(node, (ast.Expression, ast.Load)):
+            raise NotVectorizable(type(node).__name__)
+        return super().generic_visit(node)
+
+    def visit_Constant(self, node):
+        if not isinstance(node.value, (bool, int, float, str)):
+            raise NotVectorizable(repr(node.value))
+        return node
+
+    def visit_Subscript(self, node):
+        field = self.getField(node)
+        if field is None:
+            raise NotVectorizable(ast.unparse(node))
+        if field not in self.mFields:
+            self.mFields[field] = F'_col{len(self.mFields)}'
+        return ast.copy_location(ast.Name(id=self.mFields[field], ctx=ast.Load()), node)
+
+    def visit_BinOp(self, node):
+        # Arithmetic goes through _arith(), which checks for integer overflow
+        if type(node.op) not in self.mOpsBin:
+            raise NotVectorizable(type(node.op).__name__)
+        return ast.copy_location(ast.Call(func=ast.Name(id='_arith', ctx=ast.Load()),
+                                          args=[ast.Constant(self.mOpsBin[type(node.op)]), self.visit(node.left), self.visit(node.right)],
+                                          keywords=[]), node)
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            if not self.isBoolean(node.operand):
+                raise NotVectorizable(ast.unparse(node))
+            return ast.copy_location(ast.UnaryOp(op=ast.Invert(), operand=self.visit(node.operand)), node)
+        if not isinstance(node.op, (ast.UAdd, ast.USub)):
+            raise NotVectorizable(type(node.op).__name__)
+        return ast.copy_location(ast.UnaryOp(op=node.op, operand=self.visit(node.operand)), node)
+
+    def visit_BoolOp(self, node):
+        # "and"/"or" only mean "&"/"|" when both sides are already booleans
+        if not all(self.isBoolean(v) for v in node.values):
+            raise NotVectorizable(ast.unparse(node))
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        aValues = [self.visit(v) for v in node.values]
+        rslt = aValues[0]
+        for v in aValues[1:]:
+            rslt = ast.BinOp(left=rslt, op=op, right=v)
+        return ast.copy_location(rslt, node)
+
+    def visit_Compare(self, node):
+        if not all(isinstance(op, self.aOpsCmp) for op in node.ops):
+            raise NotVectorizable(ast.unparse(node))
+        aOperands = [self.visit(v) for v in (node.left, *node.comparators)]
+        rslt = None
+        for i, op in enumerate(node.ops):
+            cmp = ast.Compare(left=aOperands[i], ops=[op], comparators=[aOperands[i+1]])
+            rslt = cmp if rslt is None else ast.BinOp(left=rslt, op=ast.BitAnd(), right=cmp)
+        return ast.copy_location(rslt, node)
+
+def vectorizeExpr(expr, fieldKey, nameRecord='record'):
+    """Rewrite an expression for columnar evaluation, fieldKey being the key field of the records
+
+    Return (code object, {field: column variable name}),
+    or raise NotVectorizable if the expression is outside the supported subset.
+    """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError as e:
+        raise NotVectorizable(str(e))
+    objVec = _Vectorizer(nameRecord, fieldKey)
+    tree = ast.fix_missing_locations(objVec.visit(tree))
+    return compile(tree, '<columnar>', 'eval'), objVec.mFields
+
+def _arith(nameOp, a, b):
+    # Python ints never overflow, but int64 arrays silently wrap around
+    import numpy as np
+    func = getattr(operator, nameOp)
+    rslt = func(a, b)
+    if nameOp in ('add', 'sub', 'mul', 'pow') and np.asarray(rslt).dtype.kind in 'iu':
+        rsltFloat = func(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+        if np.any(np.abs(rsltFloat) >= 2.0**62):
+            raise OverflowError(F"Integer overflow in {nameOp}")
+    return rslt
+
+def evalColumnar(code, mColumns, nRow):
+    """Evaluate a vectorized expression over the columns {column variable name: np.array}
+
+    Return a boolean mask of nRow entries, or raise NotVectorizable if the result isn't one.
+    Division by zero, invalid operations and overflows also raise NotVectorizable instead of giving inf/nan,
+    so that the row-wise evaluation can behave the way python does.
+    """
+    import numpy as np
+    try:
+        with np.errstate(divide='raise', invalid='raise', over='raise'):
+            rslt = eval(code, {'__builtins__': {}, '_arith': _arith}, mColumns)
+    except (FloatingPointError, ArithmeticError) as e:
+        raise NotVectorizable(F"{type(e).__name__}: {e}")
+    except Exception as e:
+        raise NotVectorizable(str(e))
+    rslt = np.asarray(rslt)
+    if rslt.dtype != np.bool_ or rslt.shape not in ((), (nRow,)):
+        raise NotVectorizable(F'Result is {rslt.dtype}{rslt.shape}, not a boolean mask')
+    return np.broadcast_to(rslt, (nRow,))
+
+def makeColumn(aValues):
+    """Make a typed numpy array out of a list of python values"""
+    import numpy as np
+    if all(type(v) is int for v in aValues):
+        try:
+            return np.array(aValues, dtype=np.int64)
+        except OverflowError:
+            pass
+    if all(type(v) in (int, float) for v in aValues):
+        return np.array(aValues, dtype=np.float64)
+    vCol = np.empty(len(aValues), dtype=object)
+    vCol[:] = aValues
+    return vCol
+
+def compileExpr(expr):
+    """Compile an expression once, to be run with eval() for every row"""
+    return compile(expr.strip(), '<expr>', 'eval')
+
+def getReferencedFields(aExprs, nameRecord):
+    """Find out which fields of the record the expressions use
+
+    Return a set of field names, or None when the record is used in some other way
+    (like record[someVariable] or passing the whole record around), meaning all the fields are needed.
+    """
+    sFields = set()
+    for expr in aExprs:
+        tree = ast.parse(expr.strip(), mode='eval')
+        sUsed = set() # ids of the Name nodes that are properly used as record['field'] or record.get('field')
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == nameRecord:
+                if not isinstance(node.slice, ast.Constant) or not isinstance(node.slice.value, str):
+                    return None
+                sFields.add(node.slice.value)
+                sUsed.add(id(node.value))
+            elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == 'get' and isinstance(node.func.value, ast.Name) and node.func.value.id == nameRecord):
+                if len(node.args) == 0 or not isinstance(node.args[0], ast.Constant) or not isinstance(node.args[0].value, str):
+                    return None
+                sFields.add(node.args[0].value)
+                sUsed.add(id(node.func.value))
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Name) and node.id == nameRecord and id(node) not in sUsed:
+                return None
+    return sFields
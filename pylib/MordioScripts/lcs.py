@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Bit-parallel longest common subsequence of token lists (Hyyro's algorithm), with python ints as bit vectors
+#
+# The second sequence b is turned into {token: bitmask of its positions} once, with makeMasks().
+# After the first i tokens of a, bit j of the vector V is 0 iff LCS(a[:i], b[:j+1]) > LCS(a[:i], b[:j]),
+# so the usual DP table is L[i][j] = j - popcount(V_i & ((1<<j)-1)), and each token of a is a few int operations.
+
+def makeMasks(aTokens):
+    """{token: bitmask of the positions of the token in aTokens}"""
+    mMasks = {}
+    for j, token in enumerate(aTokens):
+        mMasks[token] = mMasks.get(token, 0) | (1 << j)
+    return mMasks
+
+def _advance(v, mask, u):
+    return ((v + u) | (v - u)) & mask
+
+def lcsLength(aA, mMasksB, lenB):
+    """Length of the LCS of aA and b, b given as makeMasks(b) and len(b)"""
+    mask = (1 << lenB) - 1
+    v = mask
+    for token in aA:
+        u = v & mMasksB.get(token, 0)
+        if u:
+            v = _advance(v, mask, u)
+    return lenB - v.bit_count()
+
+def lcsIndices(aA, aB, mMasksB):
+    """Positions in aB of the LCS of aA and aB, found by backtracking the DP table from the end:
+    a match is taken when the tokens are equal, otherwise b is stepped back if that doesn't shorten the LCS, otherwise a is
+    """
+    mask = (1 << len(aB)) - 1
+    aV = [mask]
+    for token in aA:
+        u = aV[-1] & mMasksB.get(token, 0)
+        aV.append(_advance(aV[-1], mask, u) if u else aV[-1])
+    aIdx = []
+    i = len(aA)
+    j = len(aB)
+    while i > 0 and j > 0:
+        if aA[i-1] == aB[j-1]:
+            i -= 1
+            j -= 1
+            aIdx.append(j)
+        elif (aV[i] >> (j-1)) & 1: # L[i][j] == L[i][j-1]
+            j -= 1
+        else:
+            i -= 1
+    aIdx.reverse()
+    return aIdx
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# In-process mmseg word segmentation, through ctypes over bin/libmmseg.so
+# (built from src/mmseg, only needing C++17: make -C src/mmseg lib)
+#
+# The segmentation is the same as bin/mmseg: ASCII parts are kept as-is,
+# non-ASCII parts are segmented, and everything is separated by spaces.
+# The dictionaries can be compiled once into a flat file with save(), which is then mmap()'d on load,
+# so that loading is instant and the pages are shared between processes.
+
+import ctypes
+import os
+import sys
+
+from pathlib import Path
+
+# Where link.sh builds the library, unless MORDIOSCRIPTS_LIBMMSEG says otherwise
+PATH_LIB_DEFAULT = Path(__file__).resolve().parents[2] / 'bin' / 'libmmseg.so'
+
+_lib = None
+
+def _loadLib():
+    global _lib
+    if _lib is not None:
+        return _lib
+    lib = ctypes.CDLL(os.environ.get('MORDIOSCRIPTS_LIBMMSEG', str(PATH_LIB_DEFAULT)))
+    lib.mmseg_new.argtypes = (ctypes.c_char_p, ctypes.c_char_p)
+    lib.mmseg_new.restype = ctypes.c_void_p
+    lib.mmseg_new_compiled.argtypes = (ctypes.c_char_p,)
+    lib.mmseg_new_compiled.restype = ctypes.c_void_p
+    lib.mmseg_save_compiled.argtypes = (ctypes.c_void_p, ctypes.c_char_p)
+    lib.mmseg_save_compiled.restype = ctypes.c_int
+    lib.mmseg_delete.argtypes = (ctypes.c_void_p,)
+    lib.mmseg_delete.restype = None
+    lib.mmseg_segment_batch.argtypes = (ctypes.c_void_p, ctypes.POINTER(ctypes.c_char_p), ctypes.c_size_t,
+                                        ctypes.POINTER(ctypes.c_size_t), ctypes.POINTER(ctypes.c_size_t))
+    lib.mmseg_segment_batch.restype = ctypes.POINTER(ctypes.c_char)
+    lib.mmseg_free.argtypes = (ctypes.POINTER(ctypes.c_char),)
+    lib.mmseg_free.restype = None
+    _lib = lib
+    return lib
+
+class Segmenter:
+    """mmseg segmenter, loaded from the text dictionaries (words, tab-separated char frequencies)
+    or from a compiled dictionary made by save()
+
+    Empty dictionaries (the default) segment the non-ASCII parts into characters.
+    """
+
+    def __init__(self, fileWords='/dev/null', fileChars='/dev/null', fileCompiled=None):
+        self.lib = _loadLib()
+        if fileCompiled is not None:
+            self.ptr = self.lib.mmseg_new_compiled(os.fsencode(fileCompiled))
+            fnames = fileCompiled
+        else:
+            self.ptr = self.lib.mmseg_new(os.fsencode(fileWords), os.fsencode(fileChars))
+            fnames = F'{fileWords} {fileChars}'
+        if not self.ptr:
+            raise OSError(F"Failed to load mmseg dictionary {fnames}")
+
+    def __del__(self):
+        if getattr(self, 'ptr', None):
+            self.lib.mmseg_delete(self.ptr)
+            self.ptr = None
+
+    def save(self, fname):
+        """Compile the loaded text dictionaries into a flat file for Segmenter(fileCompiled=...)"""
+        if self.lib.mmseg_save_compiled(self.ptr, os.fsencode(fname)) != 0:
+            raise OSError(F"Failed to save the compiled mmseg dictionary {fname}")
+
+    def segmentBatch(self, aTexts):
+        """Segment a list of texts in one call, return a list of space-separated strings"""
+        if len(aTexts) == 0:
+            return []
+        # The texts go through C strings, so anything after a \0 is ignored
+        aBytes = (ctypes.c_char_p * len(aTexts))(*(text.encode('utf-8') for text in aTexts))
+        size = ctypes.c_size_t()
+        numBad = ctypes.c_size_t()
+        buf = self.lib.mmseg_segment_batch(self.ptr, aBytes, len(aTexts), ctypes.byref(size), ctypes.byref(numBad))
+        if not buf:
+            raise MemoryError("mmseg_segment_batch")
+        try:
+            aRslts = ctypes.string_at(buf, size.value).decode('utf-8').split('\0')[:-1]
+        finally:
+            self.lib.mmseg_free(buf)
+        if numBad.value > 0:
+            sys.stderr.write(F"Warning: {numBad.value} texts could not be converted to/from UTF-32, parts of them are dropped\n")
+        return aRslts
+
+    def segment(self, text):
+        return self.segmentBatch((text,))[0]
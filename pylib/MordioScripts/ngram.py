@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# N-gram counting for the evaluation units
+#
+# N-grams are tuples of tokens, counted with collections.Counter,
+# so that clipped matches are simply the sizes of Counter intersections.
+
+from collections import Counter
+
+def countNgrams(aTokens, n):
+    """Count the n-grams of a list of tokens"""
+    return Counter(zip(*(aTokens[i:] for i in range(n))))
+
+def countNgramsUpTo(aTokens, nMax):
+    """Count the 1-grams to nMax-grams of a list of tokens, as a list indexed by n-1"""
+    return [countNgrams(aTokens, n) for n in range(1, nMax+1)]
+
+def countMatches(mHyp, mRef):
+    """Number of n-grams of mHyp also in mRef, each one counted at most as many times as it appears in mRef"""
+    if len(mHyp) > len(mRef):
+        mHyp, mRef = mRef, mHyp
+    return sum(min(c, mRef[ngram]) for ngram, c in mHyp.items() if ngram in mRef)
+
+class NgramCache(dict):
+    """key -> (number of tokens, countNgramsUpTo() of the tokens) of mTexts[key], worked out when first asked for"""
+
+    def __init__(self, mTexts, nMax, funcTokenize=str.split):
+        super().__init__()
+        self.mTexts = mTexts
+        self.nMax = nMax
+        self.funcTokenize = funcTokenize
+
+    def __missing__(self, key):
+        aTokens = self.funcTokenize(self.mTexts[key])
+        rslt = (len(aTokens), countNgramsUpTo(aTokens, self.nMax))
+        self[key] = rslt
+        return rslt
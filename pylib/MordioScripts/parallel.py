@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Run a function over a stream of rows with a process pool, keeping the original order
+#
+# The functions (and initializers) must be picklable, i.e. defined at the module level.
+# The workers are forked, so they also inherit whatever the main process has set up,
+# including the /dev/fd/* from process substitutions.
+
+import multiprocessing
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+
+def _mapChunk(func, aItems):
+    return [func(item) for item in aItems]
+
+def mapChunksOrdered(funcChunk, iterItems, nJobs=1, sizeChunk=256, initializer=None, initargs=()):
+    """Yield the results of funcChunk(list of items) for consecutive chunks of items, in the input order
+
+    funcChunk must return a list of the same length as its input.
+    At most 2*nJobs chunks are in flight, so the memory stays bounded no matter how long the input is.
+    """
+    if nJobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        iterItems = iter(iterItems)
+        while True:
+            aChunk = list(islice(iterItems, sizeChunk))
+            if len(aChunk) == 0:
+                return
+            yield from funcChunk(aChunk)
+
+    iterItems = iter(iterItems)
+    with ProcessPoolExecutor(nJobs, mp_context=multiprocessing.get_context('fork'),
+                             initializer=initializer, initargs=initargs) as objPool:
+        qFutures = deque()
+        isExhausted = False
+        while True:
+            while not isExhausted and len(qFutures) < nJobs * 2:
+                aChunk = list(islice(iterItems, sizeChunk))
+                if len(aChunk) == 0:
+                    isExhausted = True
+                    break
+                qFutures.append(objPool.submit(funcChunk, aChunk))
+            if len(qFutures) == 0:
+                return
+            yield from qFutures.popleft().result()
+
+def mapOrdered(func, iterItems, nJobs=1, sizeChunk=256, initializer=None, initargs=()):
+    """Yield func(item) for each item, in the input order, using nJobs processes"""
+    if nJobs <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(func, iterItems)
+        return
+    yield from mapChunksOrdered(partial(_mapChunk, func), iterItems, nJobs, sizeChunk, initializer, initargs)
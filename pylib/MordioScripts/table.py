@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Key-indexed data tables for the table units (table-filter, table-arith, ...)
+#
+# Each table is stored column by column: the type of a column is inferred once from its first rows,
+# integer and float columns are parsed in bulk into array.array, other columns keep the per-cell
+# int -> float -> str conversion. A float column is one without any integer cell, so every value
+# keeps the same type as with the per-cell conversion.
+# Looking up a key gives a Record, where record['field'] is the list of values of that field
+# from all the rows of that key, in the order of loading, and record[fieldKey] is the key itself.
+
+import csv
+
+from array import array
+from itertools import islice
+
+SIZE_CHUNK = 65536 # Number of rows parsed in one go
+NUM_INFER = 100 # Number of rows used for inferring the type of a column
+
+# Characters that may start something int() or float() accepts
+_sStartNumeric = frozenset('+-.iInN')
+
+def parseCell(s):
+    if s is None:
+        return None
+    c = s.lstrip()[:1]
+    if not c.isdecimal() and c not in _sStartNumeric:
+        return s
+    try:
+        return int(s)
+    except ValueError:
+        try:
+            return float(s)
+        except ValueError:
+            return s
+
+def inferType(aStrs):
+    # 'q' for all int64, 'd' for all double, None for anything else (including a mix of ints and doubles)
+    aTypes = set(type(parseCell(s)) for s in aStrs)
+    if aTypes == {int}:
+        return 'q'
+    if aTypes == {float}:
+        return 'd'
+    return None
+
+def parseColumn(aStrs, typ):
+    if typ == 'q':
+        try:
+            return array('q', map(int, aStrs))
+        except (TypeError, ValueError, OverflowError):
+            pass
+    elif typ == 'd':
+        aVals = list(map(parseCell, aStrs))
+        if all(type(v) is float for v in aVals):
+            return array('d', aVals)
+        return aVals # Some ints or strings, which must stay as they are
+    return list(map(parseCell, aStrs))
+
+class Table:
+    """Rows of one table, stored column by column and indexed by key"""
+
+    def __init__(self, aFields, fieldKey, sFieldsKeep=None):
+        if fieldKey not in aFields:
+            raise KeyError(fieldKey)
+        self.fieldKey = fieldKey
+        # Later duplicated field names override earlier ones, like csv.DictReader does
+        mPos = {field: i for i, field in enumerate(aFields)}
+        self.posKey = mPos.pop(fieldKey)
+        if sFieldsKeep is not None: # Only parse and keep the fields we need
+            mPos = {field: pos for field, pos in mPos.items() if field in sFieldsKeep}
+        self.mPos = mPos
+        self.nField = len(aFields)
+        self.mTypes = {}
+        self.mColumns = {field: None for field in mPos}
+        self.mIndex = {} # key -> row index, or list of row indices when the key repeats
+        self.nRow = 0
+
+    def extend(self, aRows):
+        aRows = [row if len(row) >= self.nField else row + [None]*(self.nField-len(row)) for row in aRows if row]
+        if len(aRows) == 0:
+            return
+        mIndex = self.mIndex
+        for i, row in enumerate(aRows, self.nRow):
+            key = row[self.posKey]
+            idx = mIndex.get(key)
+            if idx is None:
+                mIndex[key] = i
+            elif type(idx) is int:
+                mIndex[key] = [idx, i]
+            else:
+                idx.append(i)
+        self.nRow += len(aRows)
+
+        for field, pos in self.mPos.items():
+            aStrs = [row[pos] for row in aRows]
+            if field not in self.mTypes:
+                self.mTypes[field] = inferType(aStrs[:NUM_INFER])
+            col = parseColumn(aStrs, self.mTypes[field])
+            colOld = self.mColumns[field]
+            if colOld is None:
+                self.mColumns[field] = col
+            elif type(colOld) is type(col):
+                colOld.extend(col)
+            else: # This chunk doesn't fit into the inferred type, fallback to a plain list
+                self.mTypes[field] = None
+                self.mColumns[field] = list(colOld) + list(map(parseCell, aStrs))
+
+    def clear(self):
+        """Drop all the rows, but keep the inferred column types"""
+        self.mColumns = {field: None for field in self.mPos}
+        self.mIndex = {}
+        self.nRow = 0
+
+    def read(self, objReader):
+        while True:
+            aRows = list(islice(objReader, SIZE_CHUNK))
+            if len(aRows) == 0:
+                break
+            self.extend(aRows)
+
+class Record:
+    """All the data about one key, accessed like record['field']"""
+    __slots__ = ('tables', 'key')
+
+    def __init__(self, tables, key):
+        self.tables = tables
+        self.key = key
+
+    def __getitem__(self, field):
+        if field == self.tables.fieldKey:
+            return self.key
+        aVals = None
+        for tbl in self.tables.aTables:
+            col = tbl.mColumns.get(field)
+            if col is None:
+                continue
+            idx = tbl.mIndex.get(self.key)
+            if idx is None:
+                continue
+            if aVals is None:
+                aVals = []
+            if type(idx) is int:
+                aVals.append(col[idx])
+            else:
+                aVals.extend(col[i] for i in idx)
+        if aVals is None:
+            raise KeyError(field)
+        return aVals
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def keys(self):
+        mFields = {self.tables.fieldKey: True}
+        for tbl in self.tables.aTables:
+            if self.key in tbl.mIndex:
+                mFields.update((field, True) for field in tbl.mColumns)
+        return mFields.keys()
+
+    def __contains__(self, field):
+        return field in self.keys()
+
+    def __repr__(self):
+        return repr({field: self[field] for field in self.keys()})
+
+class Tables:
+    """Several tables sharing the key field (the first field of the first table), looked up by key
+
+    If sFieldsKeep is given, only those fields are kept, others are dropped right when loading.
+    """
+
+    def __init__(self, sFieldsKeep=None):
+        self.fieldKey = None
+        self.aTables = []
+        self.sFieldsKeep = sFieldsKeep
+
+    def load(self, fname):
+        with open(fname, encoding='utf-8') as fp:
+            objReader = csv.reader(fp)
+            aFields = next(objReader, None)
+            if aFields is None: # Totally empty file
+                return
+            if self.fieldKey is None:
+                self.fieldKey = aFields[0]
+            tbl = Table(aFields, self.fieldKey, self.sFieldsKeep) # It should crash if fieldKey is not present, which is exactly what we want here
+            tbl.read(objReader)
+        self.aTables.append(tbl)
+
+    def __contains__(self, key):
+        return any(key in tbl.mIndex for tbl in self.aTables)
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        return Record(self, key)
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return Record(self, key)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class _SortedStream:
+    # One key-sorted table being read, holding only the rows of the current key
+    def __init__(self, fp, objReader, tbl):
+        self.fp = fp
+        self.objReader = objReader
+        self.tbl = tbl
+        self.keyLast = None
+        self.rowNext = self.readRow()
+
+    def readRow(self):
+        for row in self.objReader:
+            if not row:
+                continue
+            if len(row) < self.tbl.nField:
+                row += [None] * (self.tbl.nField - len(row))
+            return row
+        return None
+
+    def seek(self, key):
+        self.tbl.clear()
+        aRows = []
+        while self.rowNext is not None:
+            keyRow = self.rowNext[self.tbl.posKey]
+            if keyRow > key:
+                break
+            if self.keyLast is not None and keyRow < self.keyLast:
+                raise ValueError(F"Table {self.fp.name} is not sorted by key: {keyRow} comes after {self.keyLast}")
+            self.keyLast = keyRow
+            if keyRow == key:
+                aRows.append(self.rowNext)
+            self.rowNext = self.readRow()
+        self.tbl.extend(aRows)
+
+class SortedTables(Tables):
+    """Like Tables, but streamed in lockstep with key lookups in ascending order
+
+    All the tables, and the sequence of looked-up keys, must be sorted by key in python string order
+    (which is the same as LC_ALL=C sort). Only the records of the current key are held in memory,
+    and a record is only valid until the next key is looked up.
+    The tables are kept open until close(), use it in a with statement.
+    """
+
+    def __init__(self, sFieldsKeep=None):
+        super().__init__(sFieldsKeep)
+        self.aStreams = []
+        self.keyCur = None
+
+    def load(self, fname):
+        fp = open(fname, encoding='utf-8')
+        objReader = csv.reader(fp)
+        aFields = next(objReader, None)
+        if aFields is None: # Totally empty file
+            fp.close()
+            return
+        if self.fieldKey is None:
+            self.fieldKey = aFields[0]
+        tbl = Table(aFields, self.fieldKey, self.sFieldsKeep) # It should crash if fieldKey is not present, which is exactly what we want here
+        self.aStreams.append(_SortedStream(fp, objReader, tbl))
+        self.aTables.append(tbl)
+
+    def seek(self, key):
+        if key == self.keyCur:
+            return
+        if self.keyCur is not None and key < self.keyCur:
+            raise ValueError(F"Input is not sorted by key: {key} comes after {self.keyCur}")
+        self.keyCur = key
+        for stream in self.aStreams:
+            stream.seek(key)
+
+    def __contains__(self, key):
+        self.seek(key)
+        return super().__contains__(key)
+
+    def close(self):
+        for stream in self.aStreams:
+            stream.fp.close()
+
+def loadTables(aFnames, sFieldsKeep=None, isSorted=False):
+    """Load a series of tables sharing the same key field
+
+    With isSorted, the tables are streamed instead, see SortedTables.
+    Either way the result is a context manager closing the tables.
+    """
+    tables = SortedTables(sFieldsKeep) if isSorted else Tables(sFieldsKeep)
+    try:
+        for fname in aFnames:
+            tables.load(fname)
+    except BaseException:
+        tables.close()
+        raise
+    return tables
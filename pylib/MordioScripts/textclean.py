@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# The rules of text-delete-nonnlp.pl, ported to python
+#
+# deleteNonNlp() + spaceCjk() is the same as the perl script.
+# The per-character decisions (is it a word character, is it CJK) are made once for each codepoint
+# and memoized into str.translate() tables, the same way as textnorm does.
+# The regex module is only needed for the Script_Extensions property:
+# perl's \p{CJK} is only U+4E00-U+9FFF, and its \p{Hiragana} and friends are Script_Extensions.
+# (Characters that were only added to those scripts in newer unicode versions than perl's may be treated differently)
+
+import re
+import unicodedata
+
+import regex
+
+_reUrl = re.compile(R'[a-zA-Z]{3,7}://[-_○A-Za-z0-9./#%=?&]+') # Things that looks remotely like URLs
+_reEscape = re.compile(R'(\\n|\\r|\\t|\\x[0-9a-f]+)') # Apparent escape sequences
+_reSpaces = re.compile('[\t\n\x0b\x0c\r \x85\xa0\u1680\u2000-\u200a\u2028\u2029\u202f\u205f\u3000]+') # perl's \s
+_reCjk = regex.compile(R'[\u4E00-\u9FFF\p{scx=Bopomofo}\p{scx=Hiragana}\p{scx=Katakana}]')
+_reBoundary = re.compile('(?<=C)(?=O)|(?<=O)(?=C)')
+
+class _WordTable(dict):
+    # codepoint -> itself if useful to us (letters, numbers, separators, symbols and a few others), otherwise a space
+    def __missing__(self, cp):
+        c = chr(cp)
+        if c in '-/+$%@' or (unicodedata.category(c)[0] in 'LNZS' and c != '●'):
+            rslt = c
+        else:
+            rslt = ' '
+        self[cp] = rslt
+        return rslt
+
+class _CjkTable(dict):
+    # codepoint -> 'C' for CJK things, 'O' for others
+    def __missing__(self, cp):
+        rslt = 'C' if _reCjk.match(chr(cp)) else 'O'
+        self[cp] = rslt
+        return rslt
+
+_tableWord = _WordTable()
+_tableCjk = _CjkTable()
+
+def consolidateSpaces(text):
+    return _reSpaces.sub(' ', text).strip(' ')
+
+def deleteNonNlp(text):
+    """Replace URLs, escape sequences and non-word characters with spaces"""
+    text = _reUrl.sub(' ', text)
+    text = _reEscape.sub(' ', text)
+    text = text.translate(_tableWord)
+    return consolidateSpaces(text)
+
+def spaceCjk(text):
+    """Separate CJK things and non-CJK things with spaces"""
+    aPos = [m.start() for m in _reBoundary.finditer(text.translate(_tableCjk))]
+    if len(aPos) > 0:
+        text = ' '.join(text[i:j] for i, j in zip([0] + aPos, aPos + [len(text)]))
+    return consolidateSpaces(text)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Batched OpenCC conversion
+#
+# Each OpenCC.convert() call has a fixed overhead that dominates on short texts,
+# so a batch of texts is joined with a private-use character (which no OpenCC dictionary entry contains,
+# so no phrase can match across it), converted in one call, and split back.
+# If the texts contain the separator, or the split doesn't give back the same number of pieces,
+# the batch is converted one by one instead.
+
+from collections import OrderedDict
+
+SEP = '\uE000'
+
+class BatchConverter:
+    """OpenCC converter for lists of texts, with an optional LRU cache of sizeCache entries"""
+
+    def __init__(self, nameConfig, sizeCache=0):
+        import opencc
+        self.objConv = opencc.OpenCC(nameConfig)
+        self.sizeCache = sizeCache
+        self.mCache = OrderedDict()
+
+    def convert(self, text):
+        return self.convertBatch((text,))[0]
+
+    def convertBatch(self, aTexts):
+        aRslts = [None] * len(aTexts)
+        aTodo = [] # Indices of the texts not in the cache
+        for i, text in enumerate(aTexts):
+            rslt = self.mCache.get(text)
+            if rslt is None:
+                aTodo.append(i)
+            else:
+                self.mCache.move_to_end(text)
+                aRslts[i] = rslt
+        if len(aTodo) == 0:
+            return aRslts
+
+        aTextsTodo = [aTexts[i] for i in aTodo]
+        aConv = None
+        if len(aTextsTodo) > 1 and not any(SEP in text for text in aTextsTodo):
+            aConv = self.objConv.convert(SEP.join(aTextsTodo)).split(SEP)
+            if len(aConv) != len(aTextsTodo):
+                aConv = None
+        if aConv is None:
+            aConv = [self.objConv.convert(text) for text in aTextsTodo]
+
+        for i, text, rslt in zip(aTodo, aTextsTodo, aConv):
+            aRslts[i] = rslt
+            if self.sizeCache > 0:
+                self.mCache[text] = rslt
+                if len(self.mCache) > self.sizeCache:
+                    self.mCache.popitem(last=False)
+        return aRslts
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Text normalization, as done by normalize-unicode
+#
+# Each "letter" character (unicode category L*) becomes NFKC(c) with the conversion table applied,
+# everything else (punctuations, digits, spaces, ...) is kept as-is.
+# Since that only depends on the character itself, the result for each codepoint is worked out
+# once when first seen, and each text is then normalized with a single str.translate().
+#
+# Entries of the conversion table with more than one character are phrases: after the character-level
+# normalization, they are replaced leftmost-longest first, using a trie of the (normalized) phrases.
+
+import hashlib
+import os
+import pickle
+import re
+import unicodedata
+
+class _CharTable(dict):
+    # codepoint -> normalized string, filled on demand while str.translate() runs
+    def __init__(self, objTrans):
+        super().__init__()
+        self.objTrans = objTrans
+
+    def __missing__(self, cp):
+        c = chr(cp)
+        if unicodedata.category(c)[0] == 'L':
+            rslt = unicodedata.normalize('NFKC', c).translate(self.objTrans)
+        else:
+            rslt = c
+        self[cp] = rslt
+        return rslt
+
+class PhraseReplacer:
+    """Replace phrases in texts based on a {phrase: replacement} table, leftmost-longest first
+
+    The trie is nested dicts of characters, with the replacement of a complete phrase under the '' key.
+    Only the positions starting with the first character of some phrase are looked at,
+    and each of them walks at most as far as the longest phrase.
+    """
+
+    def __init__(self, mPhrases):
+        self.trie = {}
+        for phrase, replacement in mPhrases.items():
+            node = self.trie
+            for c in phrase:
+                node = node.setdefault(c, {})
+            node[''] = replacement
+        self.reStart = re.compile('[{}]'.format(''.join(re.escape(c) for c in self.trie))) if self.trie else None
+
+    @classmethod
+    def load(cls, mPhrases, dirCache=None):
+        """Build the trie, or load it from dirCache if it was already built for the same table"""
+        if dirCache is None:
+            return cls(mPhrases)
+        digest = hashlib.sha256(repr(sorted(mPhrases.items())).encode('utf-8')).hexdigest()
+        fname = os.path.join(dirCache, F'phrases-{digest[:32]}.pkl')
+        try:
+            with open(fname, 'rb') as fp:
+                return pickle.load(fp)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            pass
+        obj = cls(mPhrases)
+        os.makedirs(dirCache, exist_ok=True)
+        fnameTemp = F'{fname}.{os.getpid()}'
+        with open(fnameTemp, 'wb') as fp:
+            pickle.dump(obj, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(fnameTemp, fname) # Atomic, in case several processes build the same cache
+        return obj
+
+    def __call__(self, text):
+        if self.reStart is None:
+            return text
+        aParts = []
+        posDone = 0 # Everything before this is already in aParts
+        match = self.reStart.search(text)
+        while match is not None:
+            posStart = match.start()
+            node = self.trie
+            replacement = None
+            for pos in range(posStart, len(text)):
+                node = node.get(text[pos])
+                if node is None:
+                    break
+                if '' in node:
+                    replacement = node['']
+                    posEnd = pos + 1
+            if replacement is None:
+                match = self.reStart.search(text, posStart + 1)
+                continue
+            aParts.append(text[posDone:posStart])
+            aParts.append(replacement)
+            posDone = posEnd
+            match = self.reStart.search(text, posEnd)
+        if posDone == 0:
+            return text
+        aParts.append(text[posDone:])
+        return ''.join(aParts)
+
+class CharNormalizer:
+    """Normalize texts character by character, based on a {bad character or phrase: good string} table"""
+
+    def __init__(self, mTrans=None, dirCache=None):
+        mTrans = mTrans or {}
+        self.table = _CharTable(str.maketrans({k: v for k, v in mTrans.items() if len(k) == 1}))
+        # The phrases must match the texts after the character-level normalization
+        mPhrases = {}
+        for phrase, replacement in mTrans.items():
+            if len(phrase) > 1:
+                mPhrases[phrase.translate(self.table)] = replacement
+        self.objPhrases = PhraseReplacer.load(mPhrases, dirCache) if mPhrases else None
+        # Pure ASCII texts can be returned untouched, unless the conversion table has something to say about them
+        self.isAsciiFixed = (all(self.table[cp] == chr(cp) for cp in range(128))
+                             and not any(phrase.isascii() for phrase in mPhrases))
+
+    def __call__(self, text):
+        if self.isAsciiFixed and text.isascii():
+            return text
+        text = text.translate(self.table)
+        if self.objPhrases is not None:
+            text = self.objPhrases(text)
+        return text
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Buffered output for the units that stream rows to stdout
+#
+# Flushing stdout after every row keeps lineProgressBar going but costs a syscall per row.
+# Instead, rows are collected in memory and written out in one go every INTERVAL_FLUSH seconds
+# by a background thread (or right away when the buffer gets large), and once more on exit,
+# so the progress stays live even while the unit is busy with a long batch.
+
+import atexit
+import io
+import sys
+import threading
+
+INTERVAL_FLUSH = 0.5 # Seconds between flushes
+SIZE_BUFFER = 1 << 20 # Flush anyway when this many characters are buffered
+
+class TimedWriter:
+    """A file-like object for csv.writer/csv.DictWriter, flushed every interval seconds by a daemon thread"""
+
+    def __init__(self, fp=None, interval=INTERVAL_FLUSH):
+        self.fp = sys.stdout if fp is None else fp
+        self.interval = interval
+        self.buf = io.StringIO()
+        self.lock = threading.Lock()
+        self.evtClosed = threading.Event()
+        self.thread = threading.Thread(target=self.flushPeriodically, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def flushPeriodically(self):
+        while not self.evtClosed.wait(self.interval):
+            try:
+                self.flush()
+            except (OSError, ValueError): # Closed pipe or file, the main thread will find out by itself
+                return
+
+    def write(self, s):
+        with self.lock:
+            self.buf.write(s)
+            if self.buf.tell() >= SIZE_BUFFER:
+                self.flushLocked()
+
+    def flush(self):
+        with self.lock:
+            self.flushLocked()
+
+    def flushLocked(self):
+        if self.buf.tell() > 0:
+            data = self.buf.getvalue()
+            self.buf.seek(0)
+            self.buf.truncate()
+            self.fp.write(data)
+            self.fp.flush()
+
+    def close(self):
+        if self.evtClosed.is_set():
+            return
+        self.evtClosed.set()
+        self.thread.join()
+        self.flush()
+        atexit.unregister(self.close)
@@ -0,0 +1,81 @@
+// Copyright 2020-2024, Hojin Koh
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// A plain C API over MMSeg, to be loaded from python with ctypes (see MordioScripts/mmseg.py)
+// Texts go in and out as UTF-8, segmented the same way as the command-line program
+
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <string_view>
+#include <vector>
+
+#include "segline.h"
+
+extern "C" {
+
+// Load from the text dictionaries (words, and tab-separated char frequencies), NULL on failure
+void* mmseg_new(const char* fileWords, const char* fileChars) {
+  auto mmseg = new MMSeg();
+  if (mmseg->load(fileWords, fileChars) != 0) {
+    delete mmseg;
+    return nullptr;
+  }
+  return mmseg;
+}
+
+// Map a dictionary made by mmseg_save_compiled(), NULL on failure
+void* mmseg_new_compiled(const char* fileCompiled) {
+  auto mmseg = new MMSeg();
+  if (mmseg->load_compiled(fileCompiled) != 0) {
+    delete mmseg;
+    return nullptr;
+  }
+  return mmseg;
+}
+
+int mmseg_save_compiled(void* mmseg, const char* fileCompiled) {
+  return static_cast<MMSeg*>(mmseg)->save_compiled(fileCompiled);
+}
+
+void mmseg_delete(void* mmseg) {
+  delete static_cast<MMSeg*>(mmseg);
+}
+
+// Segment nText texts, returning the results one after another, each terminated by '\0'
+// The total size is put in *pSize, and the buffer must be released with mmseg_free()
+// The number of texts that couldn't be fully converted is put in *pNumBad
+char* mmseg_segment_batch(void* mmseg, const char** aTexts, size_t nText, size_t* pSize, size_t* pNumBad) {
+  std::string out;
+  std::vector<std::string_view> aBad;
+  *pNumBad = 0;
+  for (size_t i = 0; i < nText; ++i) {
+    size_t numBad = aBad.size();
+    segmentText(*static_cast<MMSeg*>(mmseg), aTexts[i], out, aBad);
+    if (aBad.size() != numBad) ++*pNumBad;
+    out += '\0';
+  }
+
+  auto buf = static_cast<char*>(std::malloc(out.size()));
+  if (buf == nullptr) return nullptr;
+  std::memcpy(buf, out.data(), out.size());
+  *pSize = out.size();
+  return buf;
+}
+
+void mmseg_free(char* buf) {
+  std::free(buf);
+}
+
+} // extern "C"
@@ -20,6 +20,14 @@
 #include <iostream>
 
 #include <codecvt>
+#include <locale>
+
+#include <cstdint>
+#include <cstring>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 class MMSeg {
 public:
@@ -96,8 +104,62 @@ private:
     size_t size() const { return root_.trans_.size(); }
   };
 
+  // A pointer-free version of the trie and the char frequencies, which can be saved into a file and mmap()'d back
+  // File layout: FlatHeader, then n_nodes FlatNode, n_edges FlatEdge, n_freqs FlatFreq
+  // The edges of each node are sorted by char, and so are the freqs
+  struct FlatHeader { char magic_[8]; uint64_t n_nodes_, n_edges_, n_freqs_; };
+  struct FlatNode { uint32_t edge_begin_, edge_end_, val_; };
+  struct FlatEdge { Char ch_; uint32_t node_; };
+  struct FlatFreq { Char ch_; int32_t freq_; };
+  inline static const char FLAT_MAGIC[8] = {'M', 'M', 'S', 'E', 'G', 'T', '0', '1'};
+
+  struct FlatTrie {
+    const FlatNode *nodes_ = nullptr;
+    const FlatEdge *edges_ = nullptr;
+    const FlatFreq *freqs_ = nullptr;
+    size_t n_freqs_ = 0;
+
+    std::vector<StringP> match_all(StringIt start, StringIt end) const {
+      std::vector<StringP> ret;
+      const FlatNode *current = nodes_;
+      StringIt _start = start;
+      for (; start != end; ++start) {
+        auto ch = *start;
+        auto first = edges_ + current->edge_begin_, last = edges_ + current->edge_end_;
+        auto it = std::lower_bound(first, last, ch, [](const FlatEdge& e, Char c) { return e.ch_ < c; });
+        if (it == last || it->ch_ != ch)
+          break;
+        current = nodes_ + it->node_;
+        if (current->val_) ret.emplace_back(_start, start + 1);
+      }
+
+      return ret;
+    }
+
+    const int* find_freq(Char ch) const {
+      auto last = freqs_ + n_freqs_;
+      auto it = std::lower_bound(freqs_, last, ch, [](const FlatFreq& f, Char c) { return f.ch_ < c; });
+      if (it == last || it->ch_ != ch) return nullptr;
+      return &it->freq_;
+    }
+  };
+
   std::unordered_map<Char, int> char_freqs_;
   Trie dict_;
+  FlatTrie flat_;
+  bool use_flat_ = false; // Whether loaded from a compiled file
+  void *map_ = nullptr;
+  size_t size_map_ = 0;
+
+  std::vector<StringP> match_all(StringIt start, StringIt end) {
+    return use_flat_ ? flat_.match_all(start, end) : dict_.match_all(start, end);
+  }
+
+  const int* find_freq(Char ch) const {
+    if (use_flat_) return flat_.find_freq(ch);
+    auto it = char_freqs_.find(ch);
+    return it == char_freqs_.end() ? nullptr : &it->second;
+  }
 
   static size_t length(const StringP& w) { return std::distance(w.first, w.second); }
 
@@ -106,16 +168,16 @@ private:
     size_t length_ = 0;
     float mean_ = 0, var_ = 0, degree_ = 0;
 
-    Chunk(std::vector<StringP> words, const std::unordered_map<Char, int>& chars) : words_(std::move(words)) {
+    Chunk(std::vector<StringP> words, const MMSeg& mmseg) : words_(std::move(words)) {
       length_ = std::accumulate(words_.begin(), words_.end(), size_t(0), [&](size_t n, const StringP& w) { return n + length(w); });
       mean_ = float(length_) / words_.size();
       var_ = - std::accumulate(words_.begin(), words_.end(), float(0), [&](size_t n, const StringP& w) { return  n + (length(w) - mean_) * (length(w) - mean_); }) / words_.size();
 
       for (auto& w: words_) {
         if (length(w) != 1) continue;
-        auto it = chars.find(*w.first);
-        if (it != chars.end())
-          degree_ += std::log(float(it->second));
+        auto freq = mmseg.find_freq(*w.first);
+        if (freq != nullptr)
+          degree_ += std::log(float(*freq));
       }
     }
 
@@ -131,10 +193,10 @@ private:
     std::vector<Chunk> ret;
     std::function<void(StringIt, StringIt, int, std::vector<StringP>)> get_chunks_it = [&] (StringIt start, StringIt end, int n, std::vector<StringP> segs) {
       if (n == 0 || start == end) {
-        ret.emplace_back(std::move(segs), char_freqs_);
+        ret.emplace_back(std::move(segs), *this);
       }
       else {
-        auto m = dict_.match_all(start, end);
+        auto m = match_all(start, end);
         for (auto& w: m) {
           auto nsegs = segs;
           auto len = length(w);
@@ -151,6 +213,14 @@ private:
   }
 
 public:
+  MMSeg() = default;
+  MMSeg(const MMSeg&) = delete;
+  MMSeg& operator=(const MMSeg&) = delete;
+
+  ~MMSeg() {
+    if (map_ != nullptr) munmap(map_, size_map_);
+  }
+
   std::vector<String> segment(const String& s, int depth = 3) {
     std::vector<String> ret;
     String s2 = s;
@@ -206,6 +276,73 @@ public:
     //std::cerr << "Loaded Dict: " << dict_.size() << ", Freq: " << char_freqs_.size() << std::endl;
     return 0;
   }
+
+  // Save the dictionaries loaded by load() as a flat file for load_compiled()
+  int save_compiled(const std::string& path) const {
+    if (use_flat_) return -1;
+    std::vector<FlatNode> nodes{FlatNode{0, 0, 0}};
+    std::vector<FlatEdge> edges;
+    std::vector<const Trie::Node*> queue{&dict_.root_};
+    for (size_t i = 0; i < queue.size(); ++i) { // Breadth-first, so the node ids are the indices in queue
+      std::vector<std::pair<Char, const Trie::Node*>> trans(queue[i]->trans_.begin(), queue[i]->trans_.end());
+      std::sort(trans.begin(), trans.end(), [](const auto& x, const auto& y) { return x.first < y.first; });
+      nodes[i].edge_begin_ = edges.size();
+      for (auto& [ch, node]: trans) {
+        edges.push_back(FlatEdge{ch, uint32_t(queue.size())});
+        nodes.push_back(FlatNode{0, 0, 0});
+        queue.push_back(node);
+      }
+      nodes[i].edge_end_ = edges.size();
+      nodes[i].val_ = queue[i]->val_;
+    }
+
+    std::vector<FlatFreq> freqs;
+    for (auto& [ch, freq]: char_freqs_) freqs.push_back(FlatFreq{ch, freq});
+    std::sort(freqs.begin(), freqs.end(), [](const FlatFreq& x, const FlatFreq& y) { return x.ch_ < y.ch_; });
+
+    FlatHeader header;
+    std::memcpy(header.magic_, FLAT_MAGIC, sizeof(FLAT_MAGIC));
+    header.n_nodes_ = nodes.size();
+    header.n_edges_ = edges.size();
+    header.n_freqs_ = freqs.size();
+    std::ofstream fout(path, std::ios::binary);
+    if (!fout.is_open()) return -1;
+    fout.write(reinterpret_cast<const char*>(&header), sizeof(header));
+    fout.write(reinterpret_cast<const char*>(nodes.data()), nodes.size() * sizeof(FlatNode));
+    fout.write(reinterpret_cast<const char*>(edges.data()), edges.size() * sizeof(FlatEdge));
+    fout.write(reinterpret_cast<const char*>(freqs.data()), freqs.size() * sizeof(FlatFreq));
+    return fout.good() ? 0 : -1;
+  }
+
+  // Map a file made by save_compiled() into memory, instead of building the trie with load()
+  int load_compiled(const std::string& path) {
+    if (map_ != nullptr) return -1;
+    int fd = open(path.c_str(), O_RDONLY);
+    if (fd < 0) return -1;
+    struct stat st;
+    if (fstat(fd, &st) != 0 || size_t(st.st_size) < sizeof(FlatHeader)) {
+      close(fd);
+      return -1;
+    }
+    void *map = mmap(nullptr, st.st_size, PROT_READ, MAP_SHARED, fd, 0);
+    close(fd);
+    if (map == MAP_FAILED) return -1;
+
+    auto header = static_cast<const FlatHeader*>(map);
+    size_t size = sizeof(FlatHeader) + header->n_nodes_ * sizeof(FlatNode) + header->n_edges_ * sizeof(FlatEdge) + header->n_freqs_ * sizeof(FlatFreq);
+    if (std::memcmp(header->magic_, FLAT_MAGIC, sizeof(FLAT_MAGIC)) != 0 || header->n_nodes_ == 0 || size != size_t(st.st_size)) {
+      munmap(map, st.st_size);
+      return -1;
+    }
+    map_ = map;
+    size_map_ = st.st_size;
+    flat_.nodes_ = reinterpret_cast<const FlatNode*>(header + 1);
+    flat_.edges_ = reinterpret_cast<const FlatEdge*>(flat_.nodes_ + header->n_nodes_);
+    flat_.freqs_ = reinterpret_cast<const FlatFreq*>(flat_.edges_ + header->n_edges_);
+    flat_.n_freqs_ = header->n_freqs_;
+    use_flat_ = true;
+    return 0;
+  }
 };
 
 #if defined(MMSEG_MAIN)
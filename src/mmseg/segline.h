@@ -0,0 +1,83 @@
+// Copyright 2020-2024, Hojin Koh
+//
+// Licensed under the Apache License, Version 2.0 (the "License");
+// you may not use this file except in compliance with the License.
+// You may obtain a copy of the License at
+//
+//     http://www.apache.org/licenses/LICENSE-2.0
+//
+// Unless required by applicable law or agreed to in writing, software
+// distributed under the License is distributed on an "AS IS" BASIS,
+// WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+// See the License for the specific language governing permissions and
+// limitations under the License.
+
+// Segmentation of one piece of text, shared by the command-line program and the C API
+#pragma once
+
+#include <algorithm> // for find_if_not
+#include <cctype>
+#include <string>
+#include <string_view>
+#include <vector>
+
+#include "mmseg.h"
+
+inline bool isSpace(char c) {
+  return std::isspace(static_cast<unsigned char>(c));
+}
+
+inline std::string_view strip(std::string_view str) {
+  auto start = std::find_if_not(str.begin(), str.end(), isSpace);
+  auto end = std::find_if_not(str.rbegin(), str.rend(), isSpace).base(); // reverse search for end
+  return start == end ? "" : std::string_view(&*start, end - start);
+}
+
+// Append the segmented text to out: ASCII parts are kept as-is, non-ASCII parts are segmented by mmseg,
+// everything separated by spaces. The non-ASCII parts that fail the UTF-32 conversion are appended to aBad.
+inline void segmentText(MMSeg& mmseg, std::string_view text, std::string& out, std::vector<std::string_view>& aBad) {
+  auto textStripped = strip(text);
+
+  // Try to separate the different parts of the input text
+  bool isFirstSeg = true;
+  for (auto it = textStripped.begin(); it != textStripped.end();) {
+    it = std::find_if_not(it, textStripped.end(), isSpace);
+
+    // Find the next code-switching boundary or end of string
+    auto end = std::find_if(it, textStripped.end(), [&](char c) {
+        return (c & 0x80) != (*it & 0x80); // Different ASCII/non-ASCII
+        });
+
+    if (it == end) break;
+
+    std::string_view strSeg = strip(std::string_view(&*it, end - it));
+    if (isFirstSeg) {
+      isFirstSeg = false;
+    } else {
+      out += ' ';
+    }
+
+    // ASCII Part: just print it out
+    if (static_cast<unsigned char>(*it) < 0x80) {
+      out += strSeg;
+    } else { // Non-ASCII Part: need segmentation
+      std::u32string s;
+      try {
+        s = MMSeg::from_utf8(std::string(strSeg));
+        bool isFirstWord = true;
+        for (auto& w: mmseg.segment(s)) {
+          if (isFirstWord) {
+            isFirstWord = false;
+          } else {
+            out += ' ';
+          }
+          out += MMSeg::to_utf8(w);
+        }
+      } catch(const std::exception& e) {
+        aBad.push_back(strSeg);
+      }
+    }
+
+    it = end;
+  } // End for text segments
+}
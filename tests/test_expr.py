@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from MordioScripts.expr import NotVectorizable, evalColumnar, makeColumn, vectorizeExpr
+
+def evalMask(expr, mValues):
+    code, mFields = vectorizeExpr(expr, 'id')
+    mColumns = {nameCol: makeColumn(mValues[field]) for field, nameCol in mFields.items()}
+    return evalColumnar(code, mColumns, len(next(iter(mValues.values())))).tolist()
+
+def test_vectorized():
+    mValues = {'id': ['a', 'b', 'c'], 'x': [1, 5, 9], 'y': [0.5, 2.5, 1.0]}
+    assert evalMask("record['x'][0] > 2 and record['y'][0] < 2", mValues) == [False, False, True]
+    assert evalMask("1 < record['x'][0] * 2 <= 10 or record['id'] == 'a'", mValues) == [True, True, False]
+    assert evalMask("not record['x'][0] % 2 == 1", mValues) == [False, False, False]
+
+@pytest.mark.parametrize('expr', [
+    "record['x'] == 5", # A list of values row-wise
+    "record['id'][0] == 'a'", # The first character of the key
+    "len(record['x']) > 0",
+    "record['x'][1] > 0",
+])
+def test_not_vectorizable(expr):
+    with pytest.raises(NotVectorizable):
+        vectorizeExpr(expr, 'id')
+
+@pytest.mark.parametrize('expr', [
+    "record['x'][0] / 0 > 1",
+    "record['x'][0] // 0 > 1",
+    "record['x'][0] % 0 > 1",
+    "record['x'][0] * 4611686018427387904 > 0", # Overflows int64
+    "record['x'][0] ** 70 > 0",
+    "record['y'][0] * 1e308 > 0",
+])
+def test_arithmetic_errors(expr):
+    # Python raises or has no overflow here, so these must be left to the row-wise evaluation
+    with pytest.raises(NotVectorizable):
+        evalMask(expr, {'x': [1, 5, 9], 'y': [0.5, 2.5, 1.0]})
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import sys
+
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'units' / 'table-combine.py'
+
+def runCombine(tmp_path, aTables, aOpts=()):
+    aFnames = []
+    for i, text in enumerate(aTables):
+        fname = tmp_path / F'{i}.csv'
+        fname.write_text(text, encoding='utf-8')
+        aFnames.append(str(fname))
+    return subprocess.run([sys.executable, str(SCRIPT), *aOpts, *aFnames], capture_output=True, text=True)
+
+def test_lockstep(tmp_path):
+    rslt = runCombine(tmp_path, ('id,a\nk1,1\nk2,2\n', 'id,b\nk1,x\nk2,y\n'))
+    assert rslt.returncode == 0
+    assert rslt.stdout == 'id,a,b\nk1,1,x\nk2,2,y\n'
+
+def test_diverging_order(tmp_path):
+    rslt = runCombine(tmp_path, ('id,a\nk1,1\nk2,2\nk3,3\n', 'id,b\nk1,x\nk3,z\nk2,y\n'))
+    assert rslt.returncode == 0
+    assert rslt.stdout == 'id,a,b\nk1,1,x\nk2,2,y\nk3,3,z\n'
+
+def test_duplicate_keys_in_memory(tmp_path):
+    # A repeated key is merged into its first row, the later values win
+    rslt = runCombine(tmp_path, ('id,a\nk1,1\nk2,2\nk1,3\n', 'id,b\nk1,x\nk2,y\n'), ('--in-memory',))
+    assert rslt.returncode == 0
+    assert rslt.stdout == 'id,a,b\nk1,3,x\nk2,2,y\n'
+
+def test_duplicate_keys_default(tmp_path):
+    # A key repeating late in one input, after its combined row was already made, gives the same output as --in-memory
+    rslt = runCombine(tmp_path, ('id,a\nk1,1\nk2,2\nk3,3\nk1,4\n', 'id,b\nk1,x\nk2,y\nk3,z\n'))
+    assert rslt.returncode == 0
+    assert rslt.stdout == 'id,a,b\nk1,4,x\nk2,2,y\nk3,3,z\n'
+
+def test_duplicate_keys_shared_field(tmp_path):
+    # The field is in both tables, so the value from the later table still wins over the repeated row
+    rslt = runCombine(tmp_path, ('id,a\nk1,1\nk2,2\nk1,3\n', 'id,a,b\nk1,9,x\nk2,8,y\n'))
+    assert rslt.returncode == 0
+    assert rslt.stdout == 'id,a,b\nk1,9,x\nk2,8,y\n'
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import sys
+
+from pathlib import Path
+
+import pytest
+
+DIR_ROOT = Path(__file__).resolve().parent.parent
+SCRIPT = DIR_ROOT / 'units' / 'table-filter.py'
+
+TABLE_DATA = 'id,grade,ntoken\na,5,10\nb,3,0\nd,5,7\n'
+TABLE_DATA_REPEATED = TABLE_DATA + 'a,7,1\n' # Some keys have two values, only row-wise evaluation works
+TABLE_INPUT = 'id,text\na,x\nb,y\nc,z\nd,w\n'
+
+def runFilter(tmp_path, aOpts, expr, tableData=TABLE_DATA):
+    fname = tmp_path / 'data.csv'
+    fname.write_text(tableData, encoding='utf-8')
+    mEnv = dict(os.environ, PYTHONPATH=str(DIR_ROOT / 'pylib'))
+    return subprocess.run([sys.executable, str(SCRIPT), *aOpts, expr, str(fname)],
+                          input=TABLE_INPUT, capture_output=True, text=True, env=mEnv)
+
+@pytest.mark.parametrize('tableData', [TABLE_DATA, TABLE_DATA_REPEATED])
+@pytest.mark.parametrize('expr', [
+    "record['grade'][0] == 5",
+    "record['grade'] == [5]",
+    "record['ntoken'][0] > 5 or record['id'] == 'b'",
+    "max(record['grade']) > 4",
+])
+def test_columnar_same_as_rowwise(tmp_path, expr, tableData):
+    rsltRow = runFilter(tmp_path, (), expr, tableData)
+    rsltCol = runFilter(tmp_path, ('--columnar',), expr, tableData)
+    assert rsltRow.returncode == 0
+    assert rsltCol.returncode == 0
+    assert rsltCol.stdout == rsltRow.stdout
+
+def test_columnar_zero_division(tmp_path):
+    # Falls back to row-wise evaluation, which raises like it would without --columnar
+    rsltRow = runFilter(tmp_path, (), "record['ntoken'][0] / 0 > 1")
+    rsltCol = runFilter(tmp_path, ('--columnar',), "record['ntoken'][0] / 0 > 1")
+    assert rsltRow.returncode != 0
+    assert rsltCol.returncode != 0
+    assert 'ZeroDivisionError' in rsltCol.stderr
+    assert rsltCol.stdout == rsltRow.stdout
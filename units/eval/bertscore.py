@@ -15,19 +15,155 @@
 # limitations under the License.
 
 # Calculate BERTScore based on a reference text
+# Usage: bertscore.py [--jobs N] [--batch N] [--cache DIR] <lang> <reference table>
+#
+# The rows are read in chunks, and the texts of a chunk are sorted by length and encoded in batches,
+# so that there is little padding. The scores are then computed in batches with bert_score's greedy matching.
+# With --cache, the reference token embeddings are kept in DIR, keyed by the model and the hash of the reference text,
+# so scoring other systems against the same references doesn't encode the references again.
+# --jobs is the number of torch threads when running on CPU
 
 import csv
+import hashlib
 import os
+import pickle
 import sys
 
+from collections import defaultdict
+
+import torch
+
 from bert_score import BERTScorer
+from bert_score.utils import get_bert_embedding, greedy_cos_idf
+from torch.nn.utils.rnn import pad_sequence
+
+from MordioScripts.writer import TimedWriter
+
+SIZE_CHUNK = 4096 # Number of rows read and sorted together
+
+class RefEmbeddingCache:
+    """On-disk cache of the (token embeddings, idf weights) of reference texts, under dirCache/<model hash>/"""
+
+    def __init__(self, dirCache, hashModel):
+        self.dirCache = os.path.join(dirCache, hashlib.sha256(hashModel.encode('utf-8')).hexdigest()[:16])
+
+    def getPath(self, text):
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.dirCache, digest[:2], F'{digest}.pt')
+
+    def get(self, text):
+        try:
+            mData = torch.load(self.getPath(text), map_location='cpu')
+        except (OSError, RuntimeError, EOFError, pickle.UnpicklingError):
+            return None
+        if mData.get('text') != text: # Hash collision, or a damaged file
+            return None
+        return mData['emb'], mData['idf']
+
+    def put(self, text, stats):
+        fname = self.getPath(text)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        fnameTemp = F'{fname}.{os.getpid()}'
+        torch.save({'text': text, 'emb': stats[0], 'idf': stats[1]}, fnameTemp)
+        os.replace(fnameTemp, fname) # Atomic, in case several processes cache the same reference
+
+class BatchScorer:
+    """BERTScore of (hypothesis, reference) pairs, encoding each distinct text once per call"""
+
+    def __init__(self, lang, sizeBatch=64, dirCache=None):
+        self.objScorer = BERTScorer(lang=lang, rescale_with_baseline=False)
+        self.sizeBatch = sizeBatch
+        self.objCache = RefEmbeddingCache(dirCache, self.objScorer.hash) if dirCache else None
+        # The same weights as BERTScorer.score() without idf
+        self.mIdf = defaultdict(lambda: 1.0)
+        self.mIdf[self.objScorer._tokenizer.sep_token_id] = 0
+        self.mIdf[self.objScorer._tokenizer.cls_token_id] = 0
+
+    def encode(self, aTexts, mStats):
+        """Put the (token embeddings, idf weights) of each text into mStats, in batches of similar lengths"""
+        aTexts = sorted(aTexts, key=len)
+        for i in range(0, len(aTexts), self.sizeBatch):
+            aBatch = aTexts[i:i+self.sizeBatch]
+            embs, masks, idfs = get_bert_embedding(aBatch, self.objScorer._model, self.objScorer._tokenizer, self.mIdf,
+                                                   device=self.objScorer.device, all_layers=self.objScorer.all_layers)
+            embs = embs.cpu()
+            masks = masks.cpu()
+            idfs = idfs.cpu()
+            for j, text in enumerate(aBatch):
+                lenSeq = masks[j].sum().item()
+                mStats[text] = (embs[j, :lenSeq].clone(), idfs[j, :lenSeq].clone()) # Not views of the batch, to be saved alone
+
+    def padStats(self, aStats):
+        device = self.objScorer.device
+        emb = pad_sequence([e.to(device) for e, _ in aStats], batch_first=True, padding_value=2.0)
+        idf = pad_sequence([i.to(device) for _, i in aStats], batch_first=True)
+        lens = torch.tensor([e.size(0) for e, _ in aStats], dtype=torch.long)
+        mask = (torch.arange(lens.max().item()).expand(len(aStats), -1) < lens.unsqueeze(1)).to(device)
+        return emb, mask, idf
+
+    def score(self, aHyps, aRefs):
+        """Return a list of (p, r, f1) for each pair, in the input order"""
+        mStats = {}
+        aRefsTodo = set(aRefs)
+        if self.objCache is not None:
+            for text in list(aRefsTodo):
+                stats = self.objCache.get(text)
+                if stats is not None:
+                    mStats[text] = stats
+                    aRefsTodo.remove(text)
+        mStatsRef = {}
+        self.encode(list(aRefsTodo), mStatsRef)
+        if self.objCache is not None:
+            for text, stats in mStatsRef.items():
+                self.objCache.put(text, stats)
+        mStats.update(mStatsRef)
+        self.encode(list(set(aHyps) - mStats.keys()), mStats)
+
+        aRslts = [None] * len(aHyps)
+        aOrder = sorted(range(len(aHyps)), key=lambda i: mStats[aHyps[i]][0].size(0))
+        with torch.no_grad():
+            for i in range(0, len(aOrder), self.sizeBatch):
+                aIdx = aOrder[i:i+self.sizeBatch]
+                p, r, f = greedy_cos_idf(*self.padStats([mStats[aRefs[j]] for j in aIdx]),
+                                         *self.padStats([mStats[aHyps[j]] for j in aIdx]),
+                                         self.objScorer.all_layers)
+                for j, pp, rr, ff in zip(aIdx, p.tolist(), r.tolist(), f.tolist()):
+                    aRslts[j] = (pp, rr, ff)
+        return aRslts
+
+def readChunks(objReader):
+    aRows = []
+    for row in objReader:
+        aRows.append(row)
+        if len(aRows) >= SIZE_CHUNK:
+            yield aRows
+            aRows = []
+    if len(aRows) > 0:
+        yield aRows
 
 def main():
     fieldOutput = os.environ.get('MORDIOSCRIPTS_FIELD_OUTPUT', 'bs')
     fieldRef = os.environ.get('MORDIOSCRIPTS_FIELD_LABEL', '')
     fieldInput = os.environ.get('MORDIOSCRIPTS_FIELD_TEXT', '')
 
-    objBERTScore = BERTScorer(lang=sys.argv.pop(1), rescale_with_baseline=False)
+    nJobs = 0
+    sizeBatch = 64
+    dirCache = None
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        elif flag == '--batch':
+            sizeBatch = int(sys.argv.pop(1))
+        elif flag == '--cache':
+            dirCache = sys.argv.pop(1)
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
+
+    objBERTScore = BatchScorer(sys.argv.pop(1), sizeBatch, dirCache)
+    if nJobs > 0 and objBERTScore.objScorer.device == 'cpu':
+        torch.set_num_threads(nJobs)
     fileRef = sys.argv.pop(1)
 
     mRef = {}
@@ -45,16 +181,17 @@ def main():
     fieldKey = objReader.fieldnames[0]
     if not fieldInput:
         fieldInput = objReader.fieldnames[1]
-    objWriter = csv.DictWriter(sys.stdout, (fieldKey, F'{fieldOutput}-p', F'{fieldOutput}-r', F'{fieldOutput}-f1'), lineterminator="\n")
+    fpOut = TimedWriter()
+    objWriter = csv.DictWriter(fpOut, (fieldKey, F'{fieldOutput}-p', F'{fieldOutput}-r', F'{fieldOutput}-f1'), lineterminator="\n")
     objWriter.writeheader()
 
-    for row in objReader:
-        key = row[fieldKey]
-        text = row[fieldInput].replace("\\n", "\n").strip()
-        # The cursed brackets are because this library expects hyp to be in a list, and ref in a list of lists (to support multiple references)
-        p, r, f = objBERTScore.score([text], [[mRef[key]]])
-        objWriter.writerow({fieldKey: key, F'{fieldOutput}-p': p.item(), F'{fieldOutput}-r': r.item(), F'{fieldOutput}-f1': f.item()})
-        sys.stdout.flush()
+    for aRows in readChunks(objReader):
+        aKeys = [row[fieldKey] for row in aRows]
+        aHyps = [row[fieldInput].replace("\\n", "\n").strip() for row in aRows]
+        aRslts = objBERTScore.score(aHyps, [mRef[key] for key in aKeys])
+        for key, (p, r, f) in zip(aKeys, aRslts):
+            objWriter.writerow({fieldKey: key, F'{fieldOutput}-p': p, F'{fieldOutput}-r': r, F'{fieldOutput}-f1': f})
+        fpOut.flush() # Show the progress before the next chunk takes a while
 
 if __name__ == '__main__':
     main()
@@ -14,19 +14,68 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-# Compute Rouge-1, Rouge-2, and Rouge-L metrics based on a reference text
+# Compute sentence BLEU-4 of each row based on a reference text, and the corpus BLEU-4 of everything (to stderr)
+# The scores are the same as fast_bleu with its default smoothing (nltk's method1, epsilon 0.1)
+# The reference n-grams are counted once for each key, and the rows are scored in chunks, with --jobs N processes
 
 import csv
+import math
 import os
 import sys
 
-from fast_bleu import BLEU
+from functools import partial
+
+from MordioScripts.ngram import NgramCache, countNgrams, countMatches
+from MordioScripts.parallel import mapChunksOrdered
+from MordioScripts.writer import TimedWriter
+
+NGRAM_MAX = 4
+WEIGHTS = (1/4., 1/4., 1/4., 1/4.)
+EPSILON = 0.1 # Smoothing for the precisions with no matches
+
+def computeBleu(aMatches, aTotals, lenHyp, lenRef):
+    if aMatches[0] == 0:
+        return 0.0
+    if lenHyp > lenRef:
+        bp = 1.0
+    else:
+        bp = math.exp(1 - lenRef / lenHyp)
+    s = 0.0
+    for w, m, t in zip(WEIGHTS, aMatches, aTotals):
+        s += w * math.log((m if m > 0 else EPSILON) / t)
+    return bp * math.exp(s)
+
+# The reference n-grams, set up in the main process and inherited by the forked workers
+mRefNgrams = None
+
+def scoreRows(fieldKey, fieldInput, aRows):
+    aRslts = []
+    for row in aRows:
+        key = row[fieldKey]
+        aHyp = row[fieldInput].replace("\\n", "\n").strip().split()
+        lenRef, aRefCounts = mRefNgrams[key]
+        aMatches = []
+        aTotals = []
+        for n, mRef in enumerate(aRefCounts, 1):
+            aMatches.append(countMatches(countNgrams(aHyp, n), mRef))
+            aTotals.append(max(1, len(aHyp) - n + 1))
+        aRslts.append((key, computeBleu(aMatches, aTotals, len(aHyp), lenRef), aMatches, aTotals, len(aHyp), lenRef))
+    return aRslts
 
 def main():
+    global mRefNgrams
     fieldOutput = os.environ.get('MORDIOSCRIPTS_FIELD_OUTPUT', 'rs')
     fieldRef = os.environ.get('MORDIOSCRIPTS_FIELD_LABEL', '')
     fieldInput = os.environ.get('MORDIOSCRIPTS_FIELD_TEXT', '')
 
+    nJobs = 1
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
     fileRef = sys.argv.pop(1)
 
     mRef = {}
@@ -37,6 +86,7 @@ def main():
             fieldRef = objReader.fieldnames[1]
         for row in objReader:
             mRef[row[fieldKey]] = row[fieldRef].replace("\\n", "\n").strip()
+    mRefNgrams = NgramCache(mRef, NGRAM_MAX)
 
     sys.stdin.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
@@ -44,19 +94,23 @@ def main():
     fieldKey = objReader.fieldnames[0]
     if not fieldInput:
         fieldInput = objReader.fieldnames[1]
-    objWriter = csv.DictWriter(sys.stdout, (fieldKey, fieldOutput), lineterminator="\n")
+    objWriter = csv.DictWriter(TimedWriter(), (fieldKey, fieldOutput), lineterminator="\n")
     objWriter.writeheader()
 
-    for row in objReader:
-        key = row[fieldKey]
-        aHyp = row[fieldInput].replace("\\n", "\n").strip().split()
-        aRef = mRef[key].split()
-        # The extra bracket are because this library expects ref and hyp to be in a list
-        objBleu = BLEU([aRef], {'4gram': (1/4.,1/4.,1/4.,1/4.)})
-        mBleu = objBleu.get_score([aHyp])
+    # Corpus BLEU: the matches, totals and lengths summed over all rows
+    aMatchesAll = [0] * NGRAM_MAX
+    aTotalsAll = [0] * NGRAM_MAX
+    lenHypAll = 0
+    lenRefAll = 0
+    for key, bleu, aMatches, aTotals, lenHyp, lenRef in mapChunksOrdered(partial(scoreRows, fieldKey, fieldInput), objReader, nJobs):
+        objWriter.writerow({fieldKey: key, fieldOutput: bleu})
+        aMatchesAll = [a + b for a, b in zip(aMatchesAll, aMatches)]
+        aTotalsAll = [a + b for a, b in zip(aTotalsAll, aTotals)]
+        lenHypAll += lenHyp
+        lenRefAll += lenRef
 
-        objWriter.writerow({fieldKey: key, fieldOutput: mBleu['4gram'][0]})
-        sys.stdout.flush()
+    if lenHypAll > 0:
+        print(F"Corpus BLEU-4: {computeBleu(aMatchesAll, aTotalsAll, lenHypAll, lenRefAll)}", file=sys.stderr)
 
 if __name__ == '__main__':
     main()
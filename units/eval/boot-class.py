@@ -22,51 +22,78 @@ import csv
 import sys
 
 import numpy as np
+from scipy.sparse import csr_matrix
 from scipy.stats import bootstrap
 
 if sys.version_info < (3, 7):
     print("Error: minimum supported python version is 3.7 (for dict to preserve insertion order)", file=sys.stderr)
     sys.exit(37)
 
-# Note that scipy.stats.bootstrap will give our function data in this shape:
-# n parameters each is an np.array of (nResample, nSample)
-# if only 1 sample, n parameters each is an np.array of (nSample,)
-def getClassifierStats(*aSamples, axis=-1):
-    nLabel = (len(aSamples)-1)//3
-    mtxWeight = 1.0 / aSamples[-1]
-    nSample = mtxWeight.shape[0] if mtxWeight.ndim == 2 else 1
-    # mean TP, FP, FN for each label
-    mtxStat = np.zeros((nSample, nLabel*3))
-    # p,r,f1 for each label, plus micro+macro
-    mtxRslt = np.zeros((nSample, (nLabel+2)*3))
-    tpAll, fpAll, fnAll = 0, 0, 0
-    for i in range(nLabel):
-        tp = np.sum(aSamples[i*3]*mtxWeight, axis=axis)
-        fp = np.sum(aSamples[i*3+1]*mtxWeight, axis=axis)
-        fn = np.sum(aSamples[i*3+2]*mtxWeight, axis=axis)
-        mtxStat[:,i*3], mtxStat[:,i*3+1], mtxStat[:,i*3+2] = tp, fp, fn
-        mtxRslt[:,i*3] = tp / (tp + fp)
-        mtxRslt[:,i*3+1] = tp / (tp + fn)
-        mtxRslt[:,i*3+2] = 2*tp / (2*tp + fp + fn)
-        # These are for computing micro metrices
-        tpAll += tp
-        fpAll += fp
-        fnAll += fn
-
-    # Micro stats
-    mtxRslt[:,-6] = tpAll / (tpAll + fpAll)
-    mtxRslt[:,-5] = tpAll / (tpAll + fnAll)
-    mtxRslt[:,-4] = 2*tpAll / (2*tpAll + fpAll + fnAll)
+SIZE_BATCH_MAX = 1000 # Resamples computed together
+SIZE_BATCH_ELEMENTS = 1<<24 # ... but no more than this many resampled indices at once
+
+def getClassifierStats(mtxStat, nLabel):
+    """p,r,f1 for each label, plus micro+macro, from the (nResample, nLabel*3) matrix of weighted TP, FP, FN"""
+    tp, fp, fn = mtxStat[:,0::3], mtxStat[:,1::3], mtxStat[:,2::3]
+    mtxRslt = np.zeros((mtxStat.shape[0], (nLabel+2)*3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mtxRslt[:,0:-6:3] = tp / (tp + fp)
+        mtxRslt[:,1:-6:3] = tp / (tp + fn)
+        mtxRslt[:,2:-6:3] = 2*tp / (2*tp + fp + fn)
+
+        # Micro stats
+        tpAll, fpAll, fnAll = tp.sum(axis=1), fp.sum(axis=1), fn.sum(axis=1)
+        mtxRslt[:,-6] = tpAll / (tpAll + fpAll)
+        mtxRslt[:,-5] = tpAll / (tpAll + fnAll)
+        mtxRslt[:,-4] = 2*tpAll / (2*tpAll + fpAll + fnAll)
 
     # Macro stats
-    mtxRslt[:,-3] = np.mean(mtxRslt[:,0:-6:3], axis=axis)
-    mtxRslt[:,-2] = np.mean(mtxRslt[:,1:-6:3], axis=axis)
+    mtxRslt[:,-3] = np.mean(mtxRslt[:,0:-6:3], axis=1)
+    mtxRslt[:,-2] = np.mean(mtxRslt[:,1:-6:3], axis=1)
     # Macro f1 comes from averaging f1s, instead of using the mean precision and mean recall
     # See J. Opitz; S. Burst (2019). "Macro F1 and Macro F1". arXiv:1911.03347
-    mtxRslt[:,-1] = np.mean(mtxRslt[:,2:-6:3], axis=axis)
-    if nSample == 1:
-        return mtxRslt[0,:]
-    else:
+    mtxRslt[:,-1] = np.mean(mtxRslt[:,2:-6:3], axis=1)
+    return mtxRslt
+
+class ClassifierData:
+    """The classification results in a compact form: the predicted label index, the reference label indices and the weight of each sample
+
+    They are turned into a sparse (nData, nLabel*3) matrix of the weighted TP, FP, FN contributed by each sample,
+    so that the stats of a resample are its sample counts times that matrix.
+    If the classification is correct, then TP(ref)=TP(pred)=1
+    If the classification is incorrect, then FP(pred)=1 and FN(ref)=1/(number of refs) for each ref
+    """
+
+    def __init__(self, aIdxPred, aaIdxRef, aWeights, nLabel):
+        self.nData = len(aIdxPred)
+        self.nLabel = nLabel
+        aRows, aCols, aVals = [], [], []
+        for i, (idxPred, aIdxsRef) in enumerate(zip(aIdxPred, aaIdxRef)):
+            if idxPred in aIdxsRef:
+                aRows.append(i)
+                aCols.append(idxPred*3)
+                aVals.append(aWeights[i])
+            else:
+                aRows.append(i)
+                aCols.append(idxPred*3+1)
+                aVals.append(aWeights[i])
+                for idx in aIdxsRef:
+                    aRows.append(i)
+                    aCols.append(idx*3+2)
+                    aVals.append(aWeights[i] / len(aIdxsRef))
+        self.mtxContrib = csr_matrix((aVals, (aRows, aCols)), shape=(self.nData, nLabel*3))
+
+    # scipy.stats.bootstrap gives this the resampled sample indices,
+    # (nSample,) for the empirical value, (nResample, nSample) for a batch of resamples
+    def statistic(self, aIdx, axis=-1):
+        isSingle = (np.ndim(aIdx) == 1)
+        aIdx = np.atleast_2d(aIdx)
+        nResample, nSample = aIdx.shape
+        mtxCount = csr_matrix((np.ones(aIdx.size), (np.repeat(np.arange(nResample), nSample), aIdx.ravel())),
+                              shape=(nResample, self.nData))
+        mtxRslt = getClassifierStats((mtxCount @ self.mtxContrib).toarray(), self.nLabel)
+        if isSingle:
+            return mtxRslt[0,:]
         return mtxRslt.transpose()
 
 def main():
@@ -93,43 +120,35 @@ def main():
         for i in range(nData):
             aWeightsInv.append(nData)
 
-    # In the data matrix, each label need 3 values: TP, FP, FN, we'll add weight as the last column
-    # If the classification is correct, then TP(ref)=TP(pred)=1
-    # If the classification is incorrect, then FN(ref)=1 and FP(pred)=1
-    # Shape: (nParameter, nData) as required by scipy.stats.bootstrap
-    mSupportLabel = {}
     mTypesLabel = {v: i for i,v in enumerate(sorted(sTypesLabel))}
-    mtxData = np.zeros((len(mTypesLabel)*3+1, len(aDataRaw)), dtype=np.int32)
-    for i in range(len(aDataRaw)):
-        mtxData[-1,i] = aWeightsInv[i]
-        pred, aRefs = aDataRaw[i]
+    nLabel = len(mTypesLabel)
+    aSupportLabel = np.zeros(nLabel)
+    aIdxPred = []
+    aaIdxRef = []
+    for pred, aRefs in aDataRaw:
         # Convert into indices
-        idxPred = mTypesLabel[pred]
+        aIdxPred.append(mTypesLabel[pred])
         aIdxsRef = tuple(mTypesLabel[v] for v in aRefs)
-        if idxPred in aIdxsRef:
-            mtxData[idxPred*3,i] = 1
-        else:
-            mtxData[idxPred*3+1,i] = 1
-            for idx in aIdxsRef:
-                mtxData[idx*3+2,i] = 1.0 / len(aIdxsRef)
+        aaIdxRef.append(aIdxsRef)
         for idx in aIdxsRef:
-            mSupportLabel[idx] = mSupportLabel.get(idx, 0) + 1.0/len(aIdxsRef)
+            aSupportLabel[idx] += 1.0/len(aIdxsRef)
+    objData = ClassifierData(aIdxPred, aaIdxRef, 1.0 / np.array(aWeightsInv), nLabel)
+    nData = objData.nData
 
     # Get the empirical value for output
-    # The star notation * dieassembles the np.array at the first dimension, so the resulting dimension is (nSample,)
-    mean = getClassifierStats(*mtxData)
+    mean = objData.statistic(np.arange(nData))
     print(F"=== Tag {tagOutput} ===", file=sys.stderr)
     print(F"macro-f1 {mean[-1]:.6f} micro-f1 {mean[-4]:.6f}", file=sys.stderr)
 
 
     # Actually compute the bootstrap things
+    # The only thing resampled is the sample indices, the stats are then looked up from objData
     rslt = bootstrap(
-            mtxData,
+            (np.arange(nData),),
             confidence_level=0.95,
-            batch=1000,
+            batch=max(1, min(SIZE_BATCH_MAX, SIZE_BATCH_ELEMENTS // max(nData, 1))),
             method='basic',
-            paired=True,
-            statistic=getClassifierStats,
+            statistic=objData.statistic,
             random_state=np.random.default_rng(),
             )
     #meanBoot = rslt.bootstrap_distribution.mean(axis=-1)
@@ -149,7 +168,7 @@ def main():
     # Per-label output
     print(F"=== Tag {tagOutput} ===", file=sys.stderr)
     for label, i in mTypesLabel.items():
-        support = mSupportLabel[i]
+        support = aSupportLabel[i]
         meanF1, lowerF1, upperF1 = mean[i*3+2], lower[i*3+2], upper[i*3+2]
         print(F"{label}({support}): {meanF1:.6f} [{lowerF1:.6f}, {upperF1:.6f}]", file=sys.stderr)
         mOutput = {'tag': F'{tagOutput}-perlabel-{label}', 'support': support}
@@ -165,7 +184,7 @@ def main():
         objWriter.writerow(mOutput)
 
     # Micro statistics
-    support = mtxData.shape[1]
+    support = nData
     mOutput = {'tag': F'{tagOutput}-micro', 'support': support}
     meanF1, lowerF1, upperF1 = mean[-4], lower[-4], upper[-4]
     print(F"micro({support}): {meanF1:.6f} [{lowerF1:.6f}, {upperF1:.6f}]", file=sys.stderr)
@@ -190,7 +209,7 @@ def main():
     mOutput[F'{field}-p-95u'] = upper[-3]
     mOutput[F'{field}-r'] = mean[-2]
     mOutput[F'{field}-r-95l'] = lower[-2]
-    mOutput[F'{field}-r-95u'] = upper[-1]
+    mOutput[F'{field}-r-95u'] = upper[-2]
     mOutput[F'{field}-f1'] = meanF1
     mOutput[F'{field}-f1-95l'] = lowerF1
     mOutput[F'{field}-f1-95u'] = upperF1
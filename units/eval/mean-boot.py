@@ -15,60 +15,90 @@
 # limitations under the License.
 
 # Compute bootstrapped mean and 95% confidence interval from input table
-# When multiple table are added, assume each table get exactly the same weight
+# Usage: mean-boot.py [--jobs N] [--seed N] [--resamples N] <fields> <tag> <table>... [-- <tag> <table>...]...
+# Each group of (tag, tables) gives one output row
+# When multiple table are added to a group, assume each table get exactly the same weight
 # If you don't want this behaviour, concat the tables beforehand
+# All fields are bootstrapped together with the same resamples, reproducible with --seed, and computed with --jobs N processes
+# The groups with the same table sizes (e.g. several systems on the same test set) are also bootstrapped together
 
 import csv
 import sys
 
 import numpy as np
-from scipy.stats import bootstrap
 
-# Define the weighted mean function
-def meanWeighted(aSamples, aWeights):
-    return np.average(aSamples, weights=aWeights)
+from MordioScripts.bootstrap import N_RESAMPLE, bcaInterval, bootstrapWeightedMeans, jackknifeWeightedMeans, weightedMeans
 
-def main():
-    aFields = sys.argv[1].strip().split(',') if len(sys.argv[1]) > 0 else None
-    sys.argv.pop(1)
-    tagOutput = sys.argv.pop(1)
+def parseGroups(aArgs):
+    """Split [tag, table, ..., '--', tag, table, ...] into a list of (tag, [tables])"""
+    aGroups = []
+    while len(aArgs) > 0:
+        if '--' in aArgs:
+            aGroup = aArgs[:aArgs.index('--')]
+            aArgs = aArgs[aArgs.index('--')+1:]
+        else:
+            aGroup = aArgs
+            aArgs = []
+        if len(aGroup) < 2:
+            print(F"Error: need a tag and at least one table in each group, got {aGroup}", file=sys.stderr)
+            sys.exit(1)
+        aGroups.append((aGroup[0], aGroup[1:]))
+    return aGroups
 
-    if aFields is not None:
-        maData = {field: [] for field in aFields}
-    else:
-        maData = {} # Will be initialized later
+def loadGroup(aFnames, aFields):
+    """Load the tables of a group, return the fields, the (nData, nField) data, the weights, and the sizes of the tables"""
+    aaData = []
     aWeights = []
-    for fname in sys.argv[1:]:
+    aSizes = []
+    for fname in aFnames:
         nData = 0
         with open(fname, "r", encoding='utf-8') as fp:
             objReader = csv.DictReader(fp)
             if aFields is None:
                 aFields = objReader.fieldnames[1:]
-                maData = {field: [] for field in aFields}
             for row in objReader:
                 nData += 1
-                for field in aFields:
-                    maData[field].append(float(row[field]))
+                aaData.append([float(row[field]) for field in aFields])
         for i in range(nData):
             aWeights.append(100.0/nData)
+        aSizes.append(nData)
+    return aFields, np.array(aaData, dtype=np.float64).reshape(-1, len(aFields)), np.array(aWeights), tuple(aSizes)
+
+def main():
+    nJobs = 1
+    nResample = N_RESAMPLE
+    seed = None
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        elif flag == '--resamples':
+            nResample = int(sys.argv.pop(1))
+        elif flag == '--seed':
+            seed = int(sys.argv.pop(1))
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
+    aFields = sys.argv[1].strip().split(',') if len(sys.argv[1]) > 0 else None
+    sys.argv.pop(1)
+    aGroups = parseGroups(sys.argv[1:])
+
+    # Groups with the same table sizes have the same weights, so their data are put side by side and share the resamples
+    mLayouts = {} # sizes -> (weights, [(index of group, data)])
+    for i, (tagOutput, aFnames) in enumerate(aGroups):
+        aFields, mtxData, vWeights, aSizes = loadGroup(aFnames, aFields)
+        mLayouts.setdefault(aSizes, (vWeights, []))[1].append((i, mtxData))
 
     # Actually compute the bootstrap things
-    mOutput = {'tag': tagOutput}
-    vWeights = np.array(aWeights)
-    print(F"=== Tag {tagOutput} ===", file=sys.stderr)
-    for field in aFields:
-        rslt = bootstrap(
-                (np.array(maData[field]), vWeights),
-                statistic=meanWeighted,
-                paired=True,
-                confidence_level=0.95,
-                )
-        mean = rslt.bootstrap_distribution.mean()
-        lower, upper = rslt.confidence_interval
-        print(F"{field}: {mean:.6f} ({lower:.6f} ~ {upper:.6f})", file=sys.stderr)
-        mOutput[field] = mean
-        mOutput[F'{field}-95l'] = lower
-        mOutput[F'{field}-95u'] = upper
+    nField = len(aFields)
+    aRslts = [None] * len(aGroups)
+    for vWeights, aData in mLayouts.values():
+        mtxData = np.concatenate([mtxData for _, mtxData in aData], axis=1)
+        mtxBoot = bootstrapWeightedMeans(mtxData, vWeights, nResample, seed, nJobs)
+        aLower, aUpper = bcaInterval(mtxBoot, weightedMeans(mtxData, vWeights), jackknifeWeightedMeans(mtxData, vWeights))
+        aMean = mtxBoot.mean(axis=0)
+        for j, (i, _) in enumerate(aData):
+            aRslts[i] = (aMean[j*nField:(j+1)*nField], aLower[j*nField:(j+1)*nField], aUpper[j*nField:(j+1)*nField])
 
     sys.stdout.reconfigure(encoding='utf-8')
     aCols = ['tag']
@@ -78,7 +108,16 @@ def main():
         aCols.append(F'{field}-95u')
     objWriter = csv.DictWriter(sys.stdout, aCols, lineterminator="\n")
     objWriter.writeheader()
-    objWriter.writerow(mOutput)
+
+    for (tagOutput, _), (aMean, aLower, aUpper) in zip(aGroups, aRslts):
+        mOutput = {'tag': tagOutput}
+        print(F"=== Tag {tagOutput} ===", file=sys.stderr)
+        for field, mean, lower, upper in zip(aFields, aMean, aLower, aUpper):
+            print(F"{field}: {mean:.6f} ({lower:.6f} ~ {upper:.6f})", file=sys.stderr)
+            mOutput[field] = mean
+            mOutput[F'{field}-95l'] = lower
+            mOutput[F'{field}-95u'] = upper
+        objWriter.writerow(mOutput)
 
 if __name__ == '__main__':
     main()
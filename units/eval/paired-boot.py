@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Paired significance tests between systems, from their per-row score tables
+# Usage: paired-boot.py [--jobs N] [--seed N] [--resamples N] <fields> <tag> <table> <tag> <table> [<tag> <table>]...
+# The tables are aligned by their keys (first column), only the keys in all the tables are used
+# For each pair of systems and each field, the output has the mean difference (first - second) with its bootstrapped 95% CI,
+# the p-value of the paired bootstrap test (with the bootstrap distribution shifted to the null hypothesis),
+# and the p-value of the approximate randomization test (randomly swapping the two systems on each key), both two-sided
+# All the systems, fields and pairs share the same resamples
+
+import csv
+import sys
+
+from itertools import combinations
+
+import numpy as np
+
+from MordioScripts.bootstrap import (N_RESAMPLE, bcaInterval, bootstrapWeightedMeans, jackknifeWeightedMeans,
+                                     randomizeWeightedMeans, weightedMeans)
+
+def loadTable(fname, aFields):
+    mData = {}
+    with open(fname, "r", encoding='utf-8') as fp:
+        objReader = csv.DictReader(fp)
+        fieldKey = objReader.fieldnames[0]
+        if aFields is None:
+            aFields = objReader.fieldnames[1:]
+        for row in objReader:
+            mData[row[fieldKey]] = [float(row[field]) for field in aFields]
+    return aFields, mData
+
+def getPValue(mtxNull, vObserved):
+    """Two-sided p-value of each column: how often the null distribution is at least as extreme as the observed value"""
+    return (np.count_nonzero(np.abs(mtxNull) >= np.abs(vObserved), axis=0) + 1) / (mtxNull.shape[0] + 1)
+
+def main():
+    nJobs = 1
+    nResample = N_RESAMPLE
+    seed = None
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        elif flag == '--resamples':
+            nResample = int(sys.argv.pop(1))
+        elif flag == '--seed':
+            seed = int(sys.argv.pop(1))
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
+    aFields = sys.argv[1].strip().split(',') if len(sys.argv[1]) > 0 else None
+    sys.argv.pop(1)
+    if len(sys.argv) < 5 or len(sys.argv) % 2 != 1:
+        print("Error: need (tag, table) for at least two systems", file=sys.stderr)
+        sys.exit(1)
+    aTags = sys.argv[1::2]
+    aSystems = []
+    for fname in sys.argv[2::2]:
+        aFields, mData = loadTable(fname, aFields)
+        aSystems.append(mData)
+
+    # Align the tables by key, in the order of the first one
+    aKeys = [key for key in aSystems[0] if all(key in mData for mData in aSystems[1:])]
+    nDropped = max(len(mData) for mData in aSystems) - len(aKeys)
+    if nDropped > 0:
+        print(F"Warning: {nDropped} keys are not in all the tables and are ignored", file=sys.stderr)
+    if len(aKeys) == 0:
+        print("Error: no key is in all the tables", file=sys.stderr)
+        sys.exit(1)
+    nField = len(aFields)
+    # (nData, nSystem*nField), fields of each system side by side
+    mtxData = np.array([[v for mData in aSystems for v in mData[key]] for key in aKeys], dtype=np.float64)
+    vWeights = np.ones(len(aKeys))
+
+    # Paired differences of each (pair, field), as columns
+    aPairs = list(combinations(range(len(aSystems)), 2))
+    mtxDiff = np.concatenate([mtxData[:, i*nField:(i+1)*nField] - mtxData[:, j*nField:(j+1)*nField] for i, j in aPairs], axis=1)
+    vDiff = weightedMeans(mtxDiff, vWeights)
+
+    seedBoot, seedRand = np.random.SeedSequence(seed).spawn(2)
+    # The bootstrap means of all systems come from the same resamples, so their differences are paired
+    mtxBootSys = bootstrapWeightedMeans(mtxData, vWeights, nResample, seedBoot, nJobs)
+    mtxBoot = np.concatenate([mtxBootSys[:, i*nField:(i+1)*nField] - mtxBootSys[:, j*nField:(j+1)*nField] for i, j in aPairs], axis=1)
+    aLower, aUpper = bcaInterval(mtxBoot, vDiff, jackknifeWeightedMeans(mtxDiff, vWeights))
+    aPBoot = getPValue(mtxBoot - vDiff, vDiff)
+    aPRand = getPValue(randomizeWeightedMeans(mtxDiff, vWeights, nResample, seedRand, nJobs), vDiff)
+
+    sys.stdout.reconfigure(encoding='utf-8')
+    aCols = ['tag']
+    for field in aFields:
+        aCols.append(F'{field}-diff')
+        aCols.append(F'{field}-diff-95l')
+        aCols.append(F'{field}-diff-95u')
+        aCols.append(F'{field}-p-boot')
+        aCols.append(F'{field}-p-ar')
+    objWriter = csv.DictWriter(sys.stdout, aCols, lineterminator="\n")
+    objWriter.writeheader()
+
+    for k, (i, j) in enumerate(aPairs):
+        tagOutput = F'{aTags[i]}-vs-{aTags[j]}'
+        mOutput = {'tag': tagOutput}
+        print(F"=== Tag {tagOutput} ({len(aKeys)} keys) ===", file=sys.stderr)
+        for m, field in enumerate(aFields):
+            idx = k*nField + m
+            print(F"{field}: {vDiff[idx]:+.6f} ({aLower[idx]:+.6f} ~ {aUpper[idx]:+.6f}) p-boot={aPBoot[idx]:.4f} p-ar={aPRand[idx]:.4f}", file=sys.stderr)
+            mOutput[F'{field}-diff'] = vDiff[idx]
+            mOutput[F'{field}-diff-95l'] = aLower[idx]
+            mOutput[F'{field}-diff-95u'] = aUpper[idx]
+            mOutput[F'{field}-p-boot'] = aPBoot[idx]
+            mOutput[F'{field}-p-ar'] = aPRand[idx]
+        objWriter.writerow(mOutput)
+
+if __name__ == '__main__':
+    main()
@@ -15,22 +15,103 @@
 # limitations under the License.
 
 # Compute Rouge-1, Rouge-2, and Rouge-L metrics based on a reference text
+# The scores are the same as rouge_metric's PyRouge on each (hypothesis, reference) pair:
+# lines are sentences, tokens are separated by spaces, and Rouge-L is the summary-level one (union LCS) for multi-line texts.
+# The reference n-grams and LCS bitmasks are worked out once for each key, and the rows are scored with --jobs N processes
 
 import csv
 import os
 import sys
 
-from rouge_metric import PyRouge
+from collections import Counter
+from functools import partial
+
+from MordioScripts.lcs import lcsIndices, lcsLength, makeMasks
+from MordioScripts.ngram import countMatches, countNgramsUpTo
+from MordioScripts.parallel import mapChunksOrdered
+from MordioScripts.writer import TimedWriter
+
+class RefCache(dict):
+    # key -> (length of the text, all tokens, n-gram counts, [(tokens, bitmasks) of each line])
+    def __init__(self, mRef):
+        super().__init__()
+        self.mRef = mRef
+
+    def __missing__(self, key):
+        text = self.mRef[key]
+        aTokens = text.split()
+        aSents = []
+        for sent in text.split('\n'):
+            aSentTokens = sent.split()
+            aSents.append((aSentTokens, makeMasks(aSentTokens)))
+        rslt = (len(text), aTokens, countNgramsUpTo(aTokens, 2), aSents)
+        self[key] = rslt
+        return rslt
+
+def computeScores(nMatch, nHyp, nRef):
+    p = nMatch / nHyp if nHyp != 0 else 0.0
+    r = nMatch / nRef if nRef != 0 else 0.0
+    if p == 0 or r == 0:
+        return p, r, 0.0
+    return p, r, r * p / (0.5 * r + 0.5 * p)
+
+def countLcsMatches(aHypSents, aHypTokens, aRefSents):
+    if len(aHypSents) == 1 and len(aRefSents) == 1:
+        return lcsLength(aHypSents[0], aRefSents[0][1], len(aRefSents[0][0]))
+    # Summary-level: for each reference line, the union of its LCS with each hypothesis line,
+    # with each hypothesis token used at most once
+    mBudget = Counter(aHypTokens)
+    nMatch = 0
+    for aRefTokens, mMasks in aRefSents:
+        setIdx = set()
+        for aHypSent in aHypSents:
+            setIdx.update(lcsIndices(aHypSent, aRefTokens, mMasks))
+        for idx in setIdx:
+            token = aRefTokens[idx]
+            if mBudget[token] > 0:
+                mBudget[token] -= 1
+                nMatch += 1
+    return nMatch
+
+# The reference cache, set up in the main process and inherited by the forked workers
+mRefCache = None
+
+def scoreRows(fieldKey, fieldInput, aRows):
+    aRslts = []
+    for row in aRows:
+        key = row[fieldKey]
+        lenRef, aRefTokens, aRefCounts, aRefSents = mRefCache[key]
+        text = row[fieldInput].replace("\\n", "\n").strip()
+        # Length constraint
+        if len(text) > lenRef:
+            text = text[:lenRef]
+        aHypTokens = text.split()
+        aHypCounts = countNgramsUpTo(aHypTokens, 2)
+        aHypSents = [sent.split() for sent in text.split('\n')]
+
+        aScores = []
+        for mHyp, mRef in zip(aHypCounts, aRefCounts):
+            aScores.append(computeScores(countMatches(mHyp, mRef), mHyp.total(), mRef.total()))
+        aScores.append(computeScores(countLcsMatches(aHypSents, aHypTokens, aRefSents), len(aHypTokens), len(aRefTokens)))
+        aRslts.append((key, aScores))
+    return aRslts
 
 def main():
+    global mRefCache
     fieldOutput = os.environ.get('MORDIOSCRIPTS_FIELD_OUTPUT', 'rs')
     fieldRef = os.environ.get('MORDIOSCRIPTS_FIELD_LABEL', '')
     fieldInput = os.environ.get('MORDIOSCRIPTS_FIELD_TEXT', '')
 
+    nJobs = 1
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
     fileRef = sys.argv.pop(1)
-    objRouge = PyRouge(rouge_n=(1, 2), rouge_l=True)
 
-    aTypes = ('rouge-1', 'rouge-2', 'rouge-l')
     mRef = {}
     with open(fileRef, "r", encoding='utf-8') as fp:
         objReader = csv.DictReader(fp)
@@ -39,6 +120,7 @@ def main():
             fieldRef = objReader.fieldnames[1]
         for row in objReader:
             mRef[row[fieldKey]] = row[fieldRef].replace("\\n", "\n").strip()
+    mRefCache = RefCache(mRef)
 
     sys.stdin.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
@@ -46,29 +128,22 @@ def main():
     fieldKey = objReader.fieldnames[0]
     if not fieldInput:
         fieldInput = objReader.fieldnames[1]
+    aTypes = (F'{fieldOutput}1', F'{fieldOutput}2', F'{fieldOutput}l')
     aCols = [fieldKey]
-    for typ in (F'{fieldOutput}1', F'{fieldOutput}2', F'{fieldOutput}l'):
+    for typ in aTypes:
         aCols.append(F'{typ}-p')
         aCols.append(F'{typ}-r')
         aCols.append(F'{typ}-f1')
-    objWriter = csv.DictWriter(sys.stdout, aCols, lineterminator="\n")
+    objWriter = csv.DictWriter(TimedWriter(), aCols, lineterminator="\n")
     objWriter.writeheader()
 
-    for row in objReader:
-        key = row[fieldKey]
-        text = row[fieldInput].replace("\\n", "\n").strip()
-        # Length constraint
-        if len(text) > len(mRef[key]):
-            text = text[:len(mRef[key])]
-        # The cursed brackets are because this library expects hyp to be in a list, and ref in a list of lists (to support multiple references)
-        mRouge = objRouge.evaluate([text], [[mRef[key]]])
+    for key, aScores in mapChunksOrdered(partial(scoreRows, fieldKey, fieldInput), objReader, nJobs):
         mRslt = {fieldKey: key}
-        for typ, typLib in ((F'{fieldOutput}1', 'rouge-1'), (F'{fieldOutput}2', 'rouge-2'), (F'{fieldOutput}l', 'rouge-l')):
-            mRslt[F'{typ}-p'] = mRouge[typLib]['p']
-            mRslt[F'{typ}-r'] = mRouge[typLib]['r']
-            mRslt[F'{typ}-f1'] = mRouge[typLib]['f']
+        for typ, (p, r, f) in zip(aTypes, aScores):
+            mRslt[F'{typ}-p'] = p
+            mRslt[F'{typ}-r'] = r
+            mRslt[F'{typ}-f1'] = f
         objWriter.writerow(mRslt)
-        sys.stdout.flush()
 
 if __name__ == '__main__':
     main()
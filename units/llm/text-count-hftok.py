@@ -23,6 +23,8 @@ import sys
 
 from transformers import AutoTokenizer
 
+from MordioScripts.writer import TimedWriter
+
 def main():
     fieldOutput = os.environ.get('MORDIOSCRIPTS_FIELD_OUTPUT', 'ntoken')
     fieldInput = os.environ.get('MORDIOSCRIPTS_FIELD_TEXT', '')
@@ -35,7 +37,7 @@ def main():
     fieldKey = objReader.fieldnames[0]
     if not fieldInput:
         fieldInput = objReader.fieldnames[1]
-    objWriter = csv.DictWriter(sys.stdout, (fieldKey, fieldOutput), lineterminator="\n")
+    objWriter = csv.DictWriter(TimedWriter(), (fieldKey, fieldOutput), lineterminator="\n")
     objWriter.writeheader()
 
     for row in objReader:
@@ -43,7 +45,6 @@ def main():
         text = row[fieldInput].replace("\\n", "\n").strip()
         nTok = len(objTok.encode(text, padding=False, truncation=False))
         objWriter.writerow({fieldKey: key, 'ntoken': nTok})
-        sys.stdout.flush()
 
 if __name__ == '__main__':
     main()
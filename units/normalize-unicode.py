@@ -18,21 +18,123 @@
 # Perform text normalization on text part of (id),(text) records (if sys.argv[1]=="text")
 # or key part of (key),(number) records from stdin (if sys.argv[1]=="key")
 # Also will do unicodedata.normalize()
+# Entries with several characters in the (bad character) column are phrases, replaced after the character-level normalization;
+# "--phrase-cache dir" keeps the built phrase trie in that directory for the next runs with the same table
+# In key mode, "--merge sum|first|last" merges the rows whose keys become the same after normalization:
+# sum adds up the numeric columns (the others take the first value, or the last with "--merge-text last"),
+# first/last keep the whole first/last row. The merged keys are written in the order of first appearance.
 
 import csv
 import os
 import sys
-import unicodedata
 
-def normalize(objTrans, text):
-    # Only normalize the "letter" parts, not punctuations
-    return "".join(list(map(
-        lambda c: unicodedata.normalize('NFKC', c).translate(objTrans)
-        if unicodedata.category(c)[0] == 'L' else c,
-        text
-        )))
+from functools import partial
+
+from MordioScripts.parallel import mapOrdered
+from MordioScripts.textnorm import CharNormalizer
+from MordioScripts.writer import TimedWriter
+
+# Only normalizes the "letter" parts, not punctuations
+objNorm = None
+
+def initNormalizer(objNormNew):
+    global objNorm
+    objNorm = objNormNew
+
+def normalizeText(fieldKey, fieldText, row):
+    text = objNorm(row[fieldText].replace("\\n", "\n").strip())
+    return {fieldKey: row[fieldKey], fieldText: text.replace("\n", "\\n")}
+
+def normalizeKey(fieldKey, row):
+    row[fieldKey] = objNorm(row[fieldKey])
+    return row
+
+def parseNumber(s):
+    # Same as table-interpolate: a number with a dot is a float, otherwise an int
+    try:
+        if s.find('.') != -1:
+            return float(s.strip())
+        return int(s.strip())
+    except ValueError:
+        return None
+
+class KeyMerger:
+    """Merge the rows of duplicated keys"""
+
+    def __init__(self, fieldKey, aFields, modeMerge, modeText):
+        self.fieldKey = fieldKey
+        self.aFieldsVal = [field for field in aFields if field != fieldKey]
+        self.modeMerge = modeMerge
+        self.isTextLast = (modeText == 'last')
+        self.mRows = {} # key -> row, or (sums, texts) in sum mode
+        self.aIsNum = [True] * len(self.aFieldsVal) # Whether each column is numeric so far
+        self.aIsFloat = [False] * len(self.aFieldsVal)
+
+    def add(self, row):
+        key = row[self.fieldKey]
+        if self.modeMerge == 'first':
+            if key not in self.mRows:
+                self.mRows[key] = row
+            return
+        if self.modeMerge == 'last':
+            self.mRows[key] = row # Still at the place of the first appearance
+            return
+
+        ent = self.mRows.get(key)
+        if ent is None:
+            ent = self.mRows[key] = ([0] * len(self.aFieldsVal), [None] * len(self.aFieldsVal))
+        aSums, aTexts = ent
+        for i, field in enumerate(self.aFieldsVal):
+            s = row[field]
+            if s is None: # Short row
+                continue
+            if aTexts[i] is None or self.isTextLast:
+                aTexts[i] = s
+            if self.aIsNum[i]:
+                val = parseNumber(s)
+                if val is None:
+                    self.aIsNum[i] = False
+                    continue
+                if type(val) is float:
+                    self.aIsFloat[i] = True
+                aSums[i] += val
+
+    def rows(self):
+        if self.modeMerge != 'sum':
+            yield from self.mRows.values()
+            return
+        for key, (aSums, aTexts) in self.mRows.items():
+            row = {self.fieldKey: key}
+            for i, field in enumerate(self.aFieldsVal):
+                if aTexts[i] is None or not self.aIsNum[i]:
+                    row[field] = aTexts[i]
+                elif self.aIsFloat[i]:
+                    row[field] = float(aSums[i])
+                else:
+                    row[field] = aSums[i]
+            yield row
 
 def main():
+    nJobs = 1
+    modeMerge = None
+    modeText = 'first'
+    dirCache = None
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        elif flag == '--merge':
+            modeMerge = sys.argv.pop(1)
+        elif flag == '--merge-text':
+            modeText = sys.argv.pop(1)
+        elif flag == '--phrase-cache':
+            dirCache = sys.argv.pop(1)
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
+    if modeMerge not in (None, 'sum', 'first', 'last') or modeText not in ('first', 'last'):
+        print(F"Error: unknown merging mode {modeMerge}/{modeText}", file=sys.stderr)
+        sys.exit(1)
     modeConv = sys.argv.pop(1) # "text or key"
     if modeConv == 'text':
         fieldText = os.environ.get('MORDIOSCRIPTS_FIELD_INPUT', '')
@@ -46,7 +148,7 @@ def main():
             fieldConv2 = objReader.fieldnames[1]
             for row in objReader:
                 mTrans[row[fieldConv1]] = row[fieldConv2]
-    objTrans = str.maketrans(mTrans)
+    objNorm = CharNormalizer(mTrans, dirCache)
 
     sys.stdin.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
@@ -56,23 +158,25 @@ def main():
         fieldKey = objReader.fieldnames[0]
         if not fieldText:
             fieldText = objReader.fieldnames[1]
-        objWriter = csv.DictWriter(sys.stdout, (fieldKey, fieldText), lineterminator="\n")
+        objWriter = csv.DictWriter(TimedWriter(), (fieldKey, fieldText), lineterminator="\n")
         objWriter.writeheader()
-        for row in objReader:
-            key = row[fieldKey]
-            text = normalize(objTrans, row[fieldText].replace("\\n", "\n").strip())
-            objWriter.writerow({fieldKey: key, fieldText: text.replace("\n", "\\n")})
-            sys.stdout.flush()
+        for row in mapOrdered(partial(normalizeText, fieldKey, fieldText), objReader, nJobs, initializer=initNormalizer, initargs=(objNorm,)):
+            objWriter.writerow(row)
 
     elif modeConv == "key":
         objReader = csv.DictReader(sys.stdin)
         fieldKey = objReader.fieldnames[0]
-        objWriter = csv.DictWriter(sys.stdout, objReader.fieldnames, lineterminator="\n")
+        objWriter = csv.DictWriter(TimedWriter(), objReader.fieldnames, lineterminator="\n")
         objWriter.writeheader()
-        for row in objReader:
-            row[fieldKey] = normalize(objTrans, row[fieldKey])
-            objWriter.writerow(row)
-            sys.stdout.flush()
+        iterRows = mapOrdered(partial(normalizeKey, fieldKey), objReader, nJobs, initializer=initNormalizer, initargs=(objNorm,))
+        if modeMerge is None:
+            for row in iterRows:
+                objWriter.writerow(row)
+        else:
+            objMerger = KeyMerger(fieldKey, objReader.fieldnames, modeMerge, modeText)
+            for row in iterRows:
+                objMerger.add(row)
+            objWriter.writerows(objMerger.rows())
 
 if __name__ == '__main__':
     main()
@@ -16,9 +16,17 @@
 
 # Combine multiple tables, stacking the columns together
 # Assumes each table contains the same set of keys
+# When the tables also share the same key order, rows are combined as they are read and kept in a temporary file;
+# once the key orders diverge, the rest of the tables are combined in memory like --in-memory does.
+# A key repeating after its combined row was kept is merged into that row when the temporary file is copied out,
+# so the output is the same as combining everything in memory
 
 import csv
+import shutil
 import sys
+import tempfile
+
+from itertools import chain
 
 if sys.version_info < (3, 7):
     print("Error: minimum supported python version is 3.7 (for dict to preserve insertion order)", file=sys.stderr)
@@ -32,27 +40,79 @@ def addToRecord(mRecord, aFields, fieldKey, row):
         mRecord[field] = row[field]
 
 def main():
+    modeInMemory = False
+    if len(sys.argv) > 1 and sys.argv[1] == '--in-memory':
+        modeInMemory = True
+        sys.argv.pop(1)
     fieldKey = None
 
-    mData = {} # Use dict to preserve insertion order and to act as a set
+    aFps = [open(fname, encoding='utf-8') for fname in sys.argv[1:]]
+    aReaders = [csv.DictReader(fp) for fp in aFps]
     mFields = {} # Use dict to preserve insertion order and to act as a set
-    for fname in sys.argv[1:]:
-        with open(fname, encoding='utf-8') as fp:
-            objReader = csv.DictReader(fp)
-            if fieldKey is None:
-                fieldKey = objReader.fieldnames[0]
-            for field in objReader.fieldnames:
-                mFields[field] = True
-            for row in objReader:
-                key = row[fieldKey] # It should crash if fieldKey is not present, which is exactly what we want here
-                if key not in mData:
-                    mData[key] = {}
-                addToRecord(mData[key], objReader.fieldnames, fieldKey, row)
+    for objReader in aReaders:
+        if fieldKey is None:
+            fieldKey = objReader.fieldnames[0]
+        for field in objReader.fieldnames:
+            mFields[field] = True
+
+    aFieldsAll = tuple(mFields.keys())
+    # Where each field finally comes from when all the tables have the key: the last table having it
+    mFieldOwner = {field: i for i, objReader in enumerate(aReaders) for field in objReader.fieldnames}
 
     sys.stdout.reconfigure(encoding='utf-8')
-    objWriter = csv.DictWriter(sys.stdout, tuple(mFields.keys()), lineterminator="\n")
+    objWriter = csv.DictWriter(sys.stdout, aFieldsAll, lineterminator="\n")
     objWriter.writeheader()
 
+    # Streaming part: go through all tables in lockstep while they agree on the keys
+    fpTemp = tempfile.TemporaryFile('w+', encoding='utf-8', newline='')
+    objWriterTemp = csv.DictWriter(fpTemp, aFieldsAll, lineterminator="\n")
+    sKeysDone = set() # Keys already combined in the temporary file
+    aRowsPending = [None] * len(aReaders)
+    while not modeInMemory:
+        aRows = [next(objReader, None) for objReader in aReaders]
+        if all(row is None for row in aRows):
+            break
+        # It should crash if fieldKey is not present, which is exactly what we want here
+        aKeys = [row[fieldKey] if row is not None else None for row in aRows]
+        key = aKeys[0]
+        if key is None or any(k != key for k in aKeys) or key in sKeysDone:
+            aRowsPending = aRows
+            break
+        mVals = {}
+        for objReader, row in zip(aReaders, aRows):
+            addToRecord(mVals, objReader.fieldnames, fieldKey, row)
+        objWriterTemp.writerow(mVals)
+        sKeysDone.add(key)
+
+    # In-memory part: whatever is left after the key orders diverge
+    mData = {} # Use dict to preserve insertion order and to act as a set
+    mRepeated = {} # Later values of keys already in the temporary file
+    for i, (objReader, rowPending) in enumerate(zip(aReaders, aRowsPending)):
+        for row in (objReader if rowPending is None else chain((rowPending,), objReader)):
+            key = row[fieldKey] # It should crash if fieldKey is not present, which is exactly what we want here
+            if key in sKeysDone:
+                # Every table had this key, so only the fields owned by this table change
+                mVals = mRepeated.setdefault(key, {})
+                for field in objReader.fieldnames:
+                    if mFieldOwner[field] == i and field != fieldKey:
+                        mVals[field] = row[field]
+                continue
+            if key not in mData:
+                mData[key] = {}
+            addToRecord(mData[key], objReader.fieldnames, fieldKey, row)
+
+    for fp in aFps:
+        fp.close()
+
+    fpTemp.seek(0)
+    if len(mRepeated) == 0:
+        shutil.copyfileobj(fpTemp, sys.stdout)
+    else:
+        for row in csv.DictReader(fpTemp, aFieldsAll):
+            row.update(mRepeated.get(row[fieldKey], ()))
+            objWriter.writerow(row)
+    fpTemp.close()
+
     for key in mData.keys():
         mVals = mData[key]
         objWriter.writerow(mVals)
@@ -20,7 +20,19 @@ import csv
 import os
 import sys
 
+from functools import partial
+
+from MordioScripts.parallel import mapOrdered
+
+def countRow(fieldKey, fieldInput, fieldOutput, row):
+    cnt = len(row[fieldInput].replace("\\n", "\n").strip().split())
+    return {fieldKey: row[fieldKey], fieldOutput: cnt}
+
 def main():
+    nJobs = 1
+    if len(sys.argv) > 1 and sys.argv[1] == '--jobs':
+        sys.argv.pop(1)
+        nJobs = int(sys.argv.pop(1))
     fieldOutput = os.environ.get('MORDIOSCRIPTS_FIELD_OUTPUT', 'ntoken')
     fieldInput = os.environ.get('MORDIOSCRIPTS_FIELD_TEXT', '')
 
@@ -33,10 +45,8 @@ def main():
     objWriter = csv.DictWriter(sys.stdout, (fieldKey, fieldOutput), lineterminator="\n")
     objWriter.writeheader()
 
-    for row in objReader:
-        key = row[fieldKey]
-        cnt = len(row[fieldInput].replace("\\n", "\n").strip().split())
-        objWriter.writerow({fieldKey: key, fieldOutput: cnt})
+    for row in mapOrdered(partial(countRow, fieldKey, fieldInput, fieldOutput), objReader, nJobs, sizeChunk=4096):
+        objWriter.writerow(row)
 
 if __name__ == '__main__':
     main()
@@ -21,56 +21,125 @@ import csv
 import re # Kept here for potential use in the expression
 import sys
 
-def addToRecord(mRecord, aFields, fieldKey, row):
-    for field in aFields:
+from array import array
+from itertools import repeat
+
+from MordioScripts.expr import NotVectorizable, compileExpr, getReferencedFields, vectorizeExpr, evalColumnar, makeColumn
+from MordioScripts.table import loadTables
+
+# Row of each key in a table, -1 where the key is absent, -2 where it repeats
+def getRowIndices(tbl, aKeys):
+    import numpy as np
+    return np.fromiter((idx if type(idx) is int else -2 for idx in map(tbl.mIndex.get, aKeys, repeat(-1))),
+                       dtype=np.int64, count=len(aKeys))
+
+# A numpy view of a whole table column
+def getColumnArray(col):
+    import numpy as np
+    if isinstance(col, array):
+        return np.frombuffer(col, dtype=np.int64 if col.typecode == 'q' else np.float64)
+    return makeColumn(col)
+
+# Evaluate the filter once over whole columns aligned to the input rows
+# Return a boolean mask over aRows, or raise NotVectorizable
+def getMaskColumnar(exprFilter, mData, fieldKey, aRows):
+    import numpy as np
+    code, mFields = vectorizeExpr(exprFilter, fieldKey)
+    aKeys = [row[fieldKey] for row in aRows]
+    aIndices = [getRowIndices(tbl, aKeys) for tbl in mData.aTables]
+    mColumns = {}
+    for field, nameCol in mFields.items():
         if field == fieldKey:
-            mRecord[fieldKey] = row[fieldKey]
+            mColumns[nameCol] = makeColumn(aKeys)
             continue
-        if field not in mRecord:
-            mRecord[field] = []
-        try:
-            val = int(row[field])
-        except:
-            try:
-                val = float(row[field])
-            except:
-                val = row[field]
-        mRecord[field].append(val)
+        vFound = np.zeros(len(aKeys), dtype=np.bool_)
+        vCol = None
+        for tbl, vIdx in zip(mData.aTables, aIndices):
+            col = tbl.mColumns.get(field)
+            if col is None:
+                continue
+            if np.any(vIdx == -2) or np.any(vFound & (vIdx >= 0)):
+                raise NotVectorizable(F"Some keys have more than one value for field {field}")
+            vHas = vIdx >= 0
+            vVals = getColumnArray(col)[vIdx[vHas]]
+            if vCol is None:
+                vCol = np.empty(len(aKeys), dtype=vVals.dtype)
+            elif vCol.dtype != vVals.dtype: # Mixed types from different tables
+                vCol = vCol.astype(object)
+                vVals = vVals.astype(object)
+            vCol[vHas] = vVals
+            vFound |= vHas
+        if vCol is None or not np.all(vFound):
+            raise NotVectorizable(F"Some keys have no value for field {field}")
+        if vCol.dtype == object:
+            vCol = makeColumn(vCol.tolist())
+        mColumns[nameCol] = vCol
+    return evalColumnar(code, mColumns, len(aRows))
 
 def main():
     modeOmit = False
-    if sys.argv[1] == '--omit-absent-keys':
-        modeOmit = True
-        sys.argv.pop(1)
+    modeColumnar = False
+    modeSorted = False
+    while sys.argv[1] in ('--omit-absent-keys', '--columnar', '--sorted'):
+        flag = sys.argv.pop(1)
+        if flag == '--omit-absent-keys':
+            modeOmit = True
+        elif flag == '--columnar':
+            modeColumnar = True
+        else:
+            modeSorted = True
+    if modeColumnar and modeSorted:
+        print("Error: --columnar needs all the filter tables in memory, and cannot be used with --sorted", file=sys.stderr)
+        sys.exit(1)
     exprFilter = sys.argv.pop(1)
 
-    fieldKey = None
-    mData = {}
-    for fname in (sys.argv[i] for i in range(1, len(sys.argv))):
-        with open(fname, encoding='utf-8') as fp:
-            objReader = csv.DictReader(fp)
-            if fieldKey is None:
-                fieldKey = objReader.fieldnames[0]
+    codeFilter = compileExpr(exprFilter)
+    with loadTables(sys.argv[1:], getReferencedFields((exprFilter,), 'record'), modeSorted) as mData:
+        fieldKey = mData.fieldKey
+
+        sys.stdin.reconfigure(encoding='utf-8')
+        sys.stdout.reconfigure(encoding='utf-8')
+        objReader = csv.DictReader(sys.stdin)
+        objWriter = csv.DictWriter(sys.stdout, objReader.fieldnames, lineterminator="\n")
+        objWriter.writeheader()
+
+        if modeColumnar:
+            aRows = []
+            aRowsKnown = [] # The rows to be judged by the filter expression
             for row in objReader:
-                key = row[fieldKey] # It should crash if fieldKey is not present, which is exactly what we want here
-                if key not in mData:
-                    mData[key] = {}
-                addToRecord(mData[key], objReader.fieldnames, fieldKey, row)
+                key = row[fieldKey] # It will crash if fieldKey is not present, which is exactly what we want here
+                if key in mData:
+                    aRowsKnown.append(row)
+                elif modeOmit:
+                    continue
+                aRows.append(row)
+            try:
+                vMask = getMaskColumnar(exprFilter, mData, fieldKey, aRowsKnown)
+            except NotVectorizable as e:
+                print(F"Warning: falling back to row-wise evaluation: {e}", file=sys.stderr)
+                vMask = []
+                for row in aRowsKnown:
+                    record = mData[row[fieldKey]]
+                    vMask.append(eval(codeFilter))
+            iKnown = 0
+            for row in aRows:
+                if row[fieldKey] not in mData:
+                    objWriter.writerow(row)
+                    continue
+                if vMask[iKnown]:
+                    objWriter.writerow(row)
+                iKnown += 1
+            return
 
-    sys.stdin.reconfigure(encoding='utf-8')
-    sys.stdout.reconfigure(encoding='utf-8')
-    objReader = csv.DictReader(sys.stdin)
-    objWriter = csv.DictWriter(sys.stdout, objReader.fieldnames, lineterminator="\n")
-    objWriter.writeheader()
-    for row in objReader:
-        key = row[fieldKey] # It will crash if fieldKey is not present, which is exactly what we want here
-        if key not in mData:
-            if not modeOmit:
+        for row in objReader:
+            key = row[fieldKey] # It will crash if fieldKey is not present, which is exactly what we want here
+            if key not in mData:
+                if not modeOmit:
+                    objWriter.writerow(row)
+                continue
+            record = mData[key]
+            if eval(codeFilter):
                 objWriter.writerow(row)
-            continue
-        record = mData[key]
-        if eval(exprFilter):
-            objWriter.writerow(row)
 
 if __name__ == '__main__':
     main()
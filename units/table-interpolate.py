@@ -16,70 +16,89 @@
 
 # Interpolate tables given in sys.argv like this: weight1 file1 weight2 file2 ...
 # If --normalize is specified before all other arguments, normalize to the sum of 1st file
+# Each file is parsed in its own process, then the weighted sum is done with numpy over aligned arrays
 
 import csv
+import multiprocessing
 import sys
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
 from math import ceil
+from operator import add
+
+import numpy as np
 
 if sys.version_info < (3, 7):
     print("Error: minimum supported python version is 3.7 (for dict to preserve insertion order)", file=sys.stderr)
     sys.exit(37)
 
+# Parse one table into (fieldKey, fieldValue, keys in order of first appearance, weighted sums of each key, total count, isFloat)
+def parseTable(fname, w):
+    with open(fname, encoding='utf-8') as fp:
+        objReader = csv.reader(fp)
+        aFields = next(objReader)
+        fieldKey = aFields[0]
+        fieldValue = aFields[1]
+
+        mIndex = {}
+        aIdx = []
+        aVals = []
+        isFloat = False
+        for row in objReader:
+            if not row:
+                continue
+            key = row[0]
+            if len(row) < 2:
+                sys.stderr.write("Warning: entry {} has no column {}, skipped\n".format(key, fieldValue))
+                continue
+            strVal = row[1]
+            if strVal.find('.') != -1:
+                aVals.append(float(strVal.strip()))
+                isFloat = True
+            else:
+                aVals.append(int(strVal.strip()))
+            if key not in mIndex:
+                mIndex[key] = len(mIndex)
+            aIdx.append(mIndex[key])
+
+    # Summed one by one in the input order, same as a plain loop would do
+    cnt = reduce(add, aVals, 0)
+    vVals = np.array(aVals, dtype=np.float64) * float(w)
+    vSum = np.bincount(np.array(aIdx, dtype=np.int64), weights=vVals, minlength=len(mIndex))
+    return fieldKey, fieldValue, list(mIndex.keys()), vSum, cnt, isFloat
+
 def main():
     modeNormalize = False
     if sys.argv[1] == '--normalize':
         modeNormalize = True
         sys.argv.pop(1)
-    fieldKey = None
-
-    isFloat = False
-    aCnt = [] # Recording the total sum of each table
-    amTable = [] # This should preserve insertion order in python 3.7+
-
-    for w, fname in ((float(sys.argv[i]), sys.argv[i+1]) for i in range(1, len(sys.argv), 2)):
-        amTable.append({})
-        mTable = amTable[-1]
-        cntThis = 0
 
-        with open(fname, encoding='utf-8') as fp:
-            objReader = csv.DictReader(fp)
-            fieldKey = objReader.fieldnames[0]
-            fieldValue = objReader.fieldnames[1]
-
-            for row in objReader:
-                key = row[fieldKey]
-                if fieldValue not in row:
-                    sys.stderr.write("Warning: entry {} has no column {}, skipped\n".format(key, fieldValue))
-                    continue
-                strVal = row[fieldValue]
-
-                if strVal.find('.') != -1:
-                    val = float(strVal.strip())
-                    isFloat = True
-                else:
-                    val = int(strVal.strip())
-
-                cntThis += val
-                val *= 1.0 * w # Force into float
+    aArgs = [(sys.argv[i+1], float(sys.argv[i])) for i in range(1, len(sys.argv), 2)]
+    if len(aArgs) > 1:
+        # Fork so that the workers can still open /dev/fd/* from process substitutions
+        with ProcessPoolExecutor(len(aArgs), mp_context=multiprocessing.get_context('fork')) as objPool:
+            aRslts = list(objPool.map(parseTable, *zip(*aArgs)))
+    else:
+        aRslts = [parseTable(*args) for args in aArgs]
 
-                if key not in mTable:
-                    mTable[key] = val
-                else:
-                    mTable[key] += val
+    fieldKey, fieldValue = aRslts[-1][0], aRslts[-1][1]
+    isFloat = any(rslt[5] for rslt in aRslts)
+    aCnt = [rslt[4] for rslt in aRslts] # Recording the total sum of each table
 
-        aCnt.append(cntThis)
+    # Map the keys of all tables into a shared index, preserving the order of first appearance
+    mIndex = {}
+    aaIdx = []
+    for rslt in aRslts:
+        aaIdx.append(np.array([mIndex.setdefault(key, len(mIndex)) for key in rslt[2]], dtype=np.int64))
 
     # Normalize each table, then add to the overall table
-    mTable = {}
-    for i, (cnt, mTableThis) in enumerate(zip(aCnt, amTable)):
-        for key in amTable[i].keys():
-            if key not in mTable:
-                mTable[key] = 0
-            if modeNormalize:
-                mTable[key] += mTableThis[key] / cnt * aCnt[0]
-            else:
-                mTable[key] += mTableThis[key]
+    vTotal = np.zeros(len(mIndex), dtype=np.float64)
+    for cnt, vIdx, rslt in zip(aCnt, aaIdx, aRslts):
+        if modeNormalize:
+            vTotal[vIdx] += rslt[3] / cnt * aCnt[0]
+        else:
+            vTotal[vIdx] += rslt[3]
 
     # Configure output
     sys.stdout.reconfigure(encoding='utf-8')
@@ -88,12 +107,10 @@ def main():
 
     # Output
     if isFloat:
-        for k in mTable.keys():
-            v = mTable[k]
+        for k, v in zip(mIndex.keys(), vTotal.tolist()):
             objWriter.writerow({fieldKey: k, fieldValue: v})
     else:
-        for k in mTable.keys():
-            v = mTable[k]
+        for k, v in zip(mIndex.keys(), vTotal.tolist()):
             objWriter.writerow({fieldKey: k, fieldValue: ceil(v)})
 
 if __name__ == '__main__':
@@ -15,49 +15,145 @@
 # limitations under the License.
 
 # Sort the table based on a certain column
+# When the rows don't fit into the memory budget, sorted runs are spilled into temporary files
+# and merged at the end (a usual external merge sort)
+# With --top N, only the first N rows of the sorted result are output, keeping just N rows in a heap
 
 import csv
+import heapq
+import pickle
 import sys
+import tempfile
+
+from operator import itemgetter
+
+SIZE_BATCH = 4096 # Number of rows pickled together in a spilled run
+NUM_RUNS_MAX = 256 # Merge the spilled runs into one when there are this many of them
+
+# Rough estimation of how much memory a row takes
+def getSizeRow(aVals):
+    return 120 + 64 * len(aVals) + sum(map(len, aVals))
+
+# Sort a run and spill it into a temporary file
+def spillRun(aRun, reverse):
+    aRun.sort(key=itemgetter(0), reverse=reverse)
+    return writeRun(aRun)
+
+def writeRun(iterRows):
+    fp = tempfile.TemporaryFile()
+    aBatch = []
+    for item in iterRows:
+        aBatch.append(item)
+        if len(aBatch) >= SIZE_BATCH:
+            pickle.dump(aBatch, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            aBatch = []
+    if len(aBatch) > 0:
+        pickle.dump(aBatch, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    fp.seek(0)
+    return fp
+
+def readRun(fp):
+    with fp:
+        while True:
+            try:
+                aBatch = pickle.load(fp)
+            except EOFError:
+                return
+            yield from aBatch
 
 def main():
     modeNumSort = False
-    if sys.argv[1] == '--do-num-sort':
-        modeNumSort = True
-        sys.argv.pop(1)
+    sizeBuffer = 1024 * 1024 * 1024
+    nTop = None
+    while sys.argv[1] in ('--do-num-sort', '--buffer-size', '--top'):
+        flag = sys.argv.pop(1)
+        if flag == '--do-num-sort':
+            modeNumSort = True
+        elif flag == '--buffer-size':
+            sizeBuffer = int(sys.argv.pop(1)) * 1024 * 1024
+        else:
+            nTop = int(sys.argv.pop(1))
 
     fieldKey = None
     fieldSort = sys.argv.pop(1)
     directionSort = sys.argv.pop(1)
+    reverse = False if directionSort == 'asc' else True
 
-    mTable = {}
+    # key -> value of the sorting field from the data tables (the later table wins),
+    # or None if the key is there but the field isn't
+    mSortVal = {}
     for fname in (sys.argv[i] for i in range(1, len(sys.argv))):
         with open(fname, encoding='utf-8') as fp:
             objReader = csv.DictReader(fp)
             if fieldKey is None:
                 fieldKey = objReader.fieldnames[0]
+            hasSortField = fieldSort in objReader.fieldnames
             for row in objReader:
                 key = row[fieldKey] # It will crash if fieldKey is not present, which is exactly what we want here
-                mTable[key] = mTable.get(key, {}) | row
+                if hasSortField:
+                    mSortVal[key] = row[fieldSort]
+                elif key not in mSortVal:
+                    mSortVal[key] = None
 
     sys.stdin.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
-    objReader = csv.DictReader(sys.stdin)
-    objWriter = csv.DictWriter(sys.stdout, objReader.fieldnames, lineterminator="\n")
-    objWriter.writeheader()
-
-    aTarget = []
-    for row in objReader:
-        key = row[fieldKey] # It will crash if fieldKey is not present, which is exactly what we want here
-        if key not in mTable:
-            continue
-        aTarget.append(row)
-
-    aTarget.sort(
-            key=lambda m: float(mTable[m[fieldKey]][fieldSort]) if modeNumSort else m[fieldSort],
-            reverse=False if directionSort == 'asc' else True,
-            )
-    for row in aTarget:
-        objWriter.writerow(row)
+    objReader = csv.reader(sys.stdin)
+    aFields = next(objReader)
+    posKey = aFields.index(fieldKey) # It will crash if fieldKey is not present, which is exactly what we want here
+    if not modeNumSort:
+        posSort = aFields.index(fieldSort)
+    objWriter = csv.writer(sys.stdout, lineterminator="\n")
+    objWriter.writerow(aFields)
+
+    # Extract the sorting keys only once for each row
+    def iterItems():
+        for aVals in objReader:
+            if not aVals:
+                continue
+            if len(aVals) < len(aFields):
+                aVals += [''] * (len(aFields) - len(aVals))
+            key = aVals[posKey]
+            if key not in mSortVal:
+                continue
+            if modeNumSort:
+                if mSortVal[key] is None:
+                    raise KeyError(fieldSort)
+                yield (float(mSortVal[key]), aVals)
+            else:
+                yield (aVals[posSort], aVals)
+
+    if nTop is not None:
+        # Same as sorted(...)[:nTop], including the stability
+        fnSelect = heapq.nlargest if reverse else heapq.nsmallest
+        for sortKey, aVals in fnSelect(nTop, iterItems(), key=itemgetter(0)):
+            objWriter.writerow(aVals)
+        return
+
+    aRun = []
+    aFpRuns = []
+    sizeRun = 0
+    for item in iterItems():
+        aRun.append(item)
+        sizeRun += getSizeRow(item[1])
+        if sizeRun > sizeBuffer:
+            aFpRuns.append(spillRun(aRun, reverse))
+            aRun = []
+            sizeRun = 0
+            if len(aFpRuns) >= NUM_RUNS_MAX: # Avoid having too many temporary files open
+                aFpRuns = [writeRun(heapq.merge(*map(readRun, aFpRuns), key=itemgetter(0), reverse=reverse))]
+
+    if len(aFpRuns) == 0:
+        aRun.sort(key=itemgetter(0), reverse=reverse)
+        for sortKey, aVals in aRun:
+            objWriter.writerow(aVals)
+        return
+
+    # The merge is stable as runs are taken in their input order
+    aRun.sort(key=itemgetter(0), reverse=reverse)
+    aIters = [readRun(fp) for fp in aFpRuns]
+    aIters.append(aRun)
+    for sortKey, aVals in heapq.merge(*aIters, key=itemgetter(0), reverse=reverse):
+        objWriter.writerow(aVals)
 
 if __name__ == '__main__':
     main()
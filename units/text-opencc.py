@@ -19,28 +19,51 @@
 import csv
 import sys
 
-import opencc
+from functools import partial
+
+from MordioScripts.parallel import mapChunksOrdered
+from MordioScripts.textconv import BatchConverter
+from MordioScripts.writer import TimedWriter
+
+objConv = None
+
+def initConverter(nameConfig, sizeCache):
+    global objConv
+    objConv = BatchConverter(nameConfig, sizeCache)
+
+def convertRows(aFields, aRows):
+    # Each field of the whole chunk of rows is converted in one batch
+    for field in aFields:
+        aTexts = [row[field].replace("\\n", "\n").strip() for row in aRows]
+        for row, textNew in zip(aRows, objConv.convertBatch(aTexts)):
+            row[field] = textNew.replace("\n", "\\n")
+    return aRows
 
 def main():
+    nJobs = 1
+    sizeCache = 0
+    while sys.argv[1].startswith('--'):
+        flag = sys.argv.pop(1)
+        if flag == '--jobs':
+            nJobs = int(sys.argv.pop(1))
+        elif flag == '--cache':
+            sizeCache = int(sys.argv.pop(1))
+        else:
+            print(F"Error: unknown option {flag}", file=sys.stderr)
+            sys.exit(1)
     nameConfig = sys.argv.pop(1)
     aFields = [field for field in sys.argv.pop(1).strip().split(',') if len(field) > 0]
-    objConv = opencc.OpenCC(nameConfig)
 
     sys.stdin.reconfigure(encoding='utf-8')
     sys.stdout.reconfigure(encoding='utf-8')
     objReader = csv.DictReader(sys.stdin)
     if len(aFields) == 0:
         aFields.append(objReader.fieldnames[1])
-    objWriter = csv.DictWriter(sys.stdout, objReader.fieldnames, lineterminator="\n")
+    objWriter = csv.DictWriter(TimedWriter(), objReader.fieldnames, lineterminator="\n")
     objWriter.writeheader()
 
-    for row in objReader:
-        for field in aFields:
-            text = row[field].replace("\\n", "\n").strip()
-            textNew = objConv.convert(text).replace("\n", "\\n")
-            row[field] = textNew
+    for row in mapChunksOrdered(partial(convertRows, aFields), objReader, nJobs, initializer=initConverter, initargs=(nameConfig, sizeCache)):
         objWriter.writerow(row)
-        sys.stdout.flush()
 
 if __name__ == '__main__':
     main()
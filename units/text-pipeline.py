@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright 2020-2024, Hojin Koh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Apply several text transformations to the text field of (id),(text) records from stdin, in one pass
+# The stages are given in sys.argv, and are applied in that order:
+#   nonnlp: delete URLs, escape sequences and non-word characters, like text-delete-nonnlp.pl
+#   space: separate CJK and non-CJK things with spaces (nonnlp then space is the same as text-delete-nonnlp.pl)
+#   normalize[=table]: unicode normalization, with an optional (bad character),(good character) table, like normalize-unicode.py text
+#   opencc=config: OpenCC conversion, like text-opencc.py
+#   seg[=word-dict,char-dict] or seg=compiled-dict: mmseg segmentation, like bc/mmseg (by default into characters)
+# The time spent in each stage is reported to stderr at the end
+
+import csv
+import os
+import sys
+import time
+
+from functools import partial
+
+from MordioScripts.mmseg import Segmenter
+from MordioScripts.parallel import mapChunksOrdered
+from MordioScripts.textclean import deleteNonNlp, spaceCjk
+from MordioScripts.textconv import BatchConverter
+from MordioScripts.textnorm import CharNormalizer
+from MordioScripts.writer import TimedWriter
+
+SIZE_CHUNK = 256 # Number of rows sent through the stages together
+
+# Stages work on the texts as stored in the table, some of them undo the "\n" escaping first like their own units do
+def escaped(func):
+    def funcEscaped(aTexts):
+        return [text.replace("\n", "\\n") for text in func([text.replace("\\n", "\n").strip() for text in aTexts])]
+    return funcEscaped
+
+def makeStage(spec):
+    name, _, arg = spec.partition('=')
+    if name == 'nonnlp':
+        return lambda aTexts: [deleteNonNlp(text) for text in aTexts]
+    if name == 'space':
+        return lambda aTexts: [spaceCjk(text) for text in aTexts]
+    if name == 'normalize':
+        mTrans = {}
+        if arg:
+            with open(arg, encoding='utf-8') as fp:
+                objReader = csv.DictReader(fp)
+                fieldConv1 = objReader.fieldnames[0]
+                fieldConv2 = objReader.fieldnames[1]
+                for row in objReader:
+                    mTrans[row[fieldConv1]] = row[fieldConv2]
+        objNorm = CharNormalizer(mTrans)
+        return escaped(lambda aTexts: [objNorm(text) for text in aTexts])
+    if name == 'opencc':
+        if not arg:
+            raise ValueError("Stage opencc needs a config, like opencc=s2twp.json")
+        return escaped(BatchConverter(arg).convertBatch)
+    if name == 'seg':
+        aFnames = [fname for fname in arg.split(',') if fname]
+        if len(aFnames) == 1:
+            objSeg = Segmenter(fileCompiled=aFnames[0])
+        else:
+            objSeg = Segmenter(*aFnames)
+        return objSeg.segmentBatch
+    raise ValueError(F"Unknown stage: {spec}")
+
+# The stages are built in the main process and inherited by the forked workers
+aStages = None
+
+def initStages(aStagesNew):
+    global aStages
+    aStages = aStagesNew
+
+def processChunk(fieldText, aRows):
+    aTexts = [row[fieldText] or '' for row in aRows]
+    aTimes = []
+    for stage in aStages:
+        timeStart = time.perf_counter()
+        aTexts = stage(aTexts)
+        aTimes.append(time.perf_counter() - timeStart)
+    for row, text in zip(aRows, aTexts):
+        row[fieldText] = text
+    # The stage times of the whole chunk go with its first row
+    return [(row, aTimes if i == 0 else None) for i, row in enumerate(aRows)]
+
+def main():
+    nJobs = 1
+    if sys.argv[1] == '--jobs':
+        sys.argv.pop(1)
+        nJobs = int(sys.argv.pop(1))
+    aSpecs = sys.argv[1:]
+    fieldText = os.environ.get('MORDIOSCRIPTS_FIELD_INPUT', '')
+
+    aStagesMain = [makeStage(spec) for spec in aSpecs]
+
+    sys.stdin.reconfigure(encoding='utf-8')
+    sys.stdout.reconfigure(encoding='utf-8')
+    objReader = csv.DictReader(sys.stdin)
+    if not fieldText:
+        fieldText = objReader.fieldnames[1]
+    objWriter = csv.DictWriter(TimedWriter(), objReader.fieldnames, lineterminator="\n")
+    objWriter.writeheader()
+
+    timeStart = time.perf_counter()
+    aTimesTotal = [0.0] * len(aSpecs) # Summed over all the workers
+    for row, aTimes in mapChunksOrdered(partial(processChunk, fieldText), objReader, nJobs, SIZE_CHUNK, initStages, (aStagesMain,)):
+        objWriter.writerow(row)
+        if aTimes is not None:
+            aTimesTotal = [t + tAdd for t, tAdd in zip(aTimesTotal, aTimes)]
+
+    for spec, t in zip(aSpecs, aTimesTotal):
+        print(F"Stage {spec}: {t:.2f}s", file=sys.stderr)
+    print(F"Total: {time.perf_counter() - timeStart:.2f}s with {nJobs} jobs", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -20,7 +20,34 @@ import csv
 import re
 import sys
 
+from functools import partial
+
+from MordioScripts.parallel import mapOrdered
+from MordioScripts.writer import TimedWriter
+
+# Return the rows of sentences of a document
+def segmentRow(fieldKey, fieldText, sepKey, item):
+    iRow, row = item
+    key = row[fieldKey]
+    text = row[fieldText].replace("\\n", "\n").strip()
+    aSplits = re.split(R'([。！？；：\.!?:;．]+\s*)', text)
+    aSents = [aSplits[i] + (aSplits[i+1] if i+1 < len(aSplits) else "")
+              for i in range(0, len(aSplits), 2)]
+    # Sanity check
+    if len(aSents) == 0:
+        print(F"Warning: No sentences in row {iRow+1}", file=sys.stderr)
+    aRows = []
+    for idSent, sent in enumerate(aSents):
+        if len(sent.strip()) == 0:
+            continue
+        aRows.append({fieldKey: F"{key}{sepKey}{idSent+1:05d}", fieldText: sent.strip()})
+    return aRows
+
 def main():
+    nJobs = 1
+    if sys.argv[1] == '--jobs':
+        sys.argv.pop(1)
+        nJobs = int(sys.argv.pop(1))
     sepKey = sys.argv.pop(1)
 
     sys.stdin.reconfigure(encoding='utf-8')
@@ -29,23 +56,11 @@ def main():
     fieldKey = objReader.fieldnames[0]
     fieldText = objReader.fieldnames[1]
 
-    objWriter = csv.DictWriter(sys.stdout, (fieldKey, fieldText), lineterminator="\n")
+    objWriter = csv.DictWriter(TimedWriter(), (fieldKey, fieldText), lineterminator="\n")
     objWriter.writeheader()
 
-    for i, row in enumerate(objReader):
-        key = row[fieldKey]
-        text = row[fieldText].replace("\\n", "\n").strip()
-        aSplits = re.split(R'([。！？；：\.!?:;．]+\s*)', text)
-        aSents = [aSplits[i] + (aSplits[i+1] if i+1 < len(aSplits) else "")
-                  for i in range(0, len(aSplits), 2)]
-        # Sanity check
-        if len(aSents) == 0:
-            print(F"Warning: No sentences in row {i+1}", file=sys.stderr)
-        for idSent, sent in enumerate(aSents):
-            if len(sent.strip()) == 0:
-                continue
-            objWriter.writerow({fieldKey: F"{key}{sepKey}{idSent+1:05d}", fieldText: sent.strip()})
-        sys.stdout.flush()
+    for aRows in mapOrdered(partial(segmentRow, fieldKey, fieldText, sepKey), enumerate(objReader), nJobs):
+        objWriter.writerows(aRows)
 
 if __name__ == '__main__':
     main()
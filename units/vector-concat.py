@@ -19,21 +19,8 @@
 import sys
 import tarfile
 
-def addToRecord(mRecord, aFields, fieldKey, row):
-    for field in aFields:
-        if field == fieldKey:
-            mRecord[fieldKey] = row[fieldKey]
-            continue
-        if field not in mRecord:
-            mRecord[field] = []
-        try:
-            val = int(row[field])
-        except:
-            try:
-                val = float(row[field])
-            except:
-                val = row[field]
-        mRecord[field].append(val)
+from MordioScripts.expr import compileExpr, getReferencedFields
+from MordioScripts.table import loadTables
 
 def main():
     modeOmit = False
@@ -42,18 +29,9 @@ def main():
         sys.argv.pop(1)
     exprFilter = sys.argv.pop(1)
 
-    fieldKey = None
-    mData = {}
-    for fname in (sys.argv[i] for i in range(1, len(sys.argv))):
-        with open(fname, encoding='utf-8') as fp:
-            objReader = csv.DictReader(fp)
-            if fieldKey is None:
-                fieldKey = objReader.fieldnames[0]
-            for row in objReader:
-                key = row[fieldKey] # It should crash if fieldKey is not present, which is exactly what we want here
-                if key not in mData:
-                    mData[key] = {}
-                addToRecord(mData[key], objReader.fieldnames, fieldKey, row)
+    codeFilter = compileExpr(exprFilter)
+    mData = loadTables(sys.argv[1:], getReferencedFields((exprFilter,), 'record'))
+    fieldKey = mData.fieldKey
 
     fpTar = tarfile.open(fileobj=sys.stdin.buffer, mode='r|')
     with tarfile.open(fileobj=sys.stdout.buffer, mode='w|') as fpwTar:
@@ -67,7 +45,7 @@ def main():
                     fpwTar.addfile(entry, fileobj=fpFile)
                 continue
             record = mData[key]
-            if eval(exprFilter):
+            if eval(codeFilter):
                 fpwTar.addfile(entry, fileobj=fpFile)
 
 if __name__ == '__main__':